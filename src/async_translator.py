@@ -3,6 +3,7 @@ Async Translator - Traduttore asincrono per massimizzare performance con OpenAI
 """
 
 import asyncio
+import re
 import aiohttp
 from typing import List, Dict, Optional, Tuple, Any
 import time
@@ -14,13 +15,20 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Riga numerata della risposta a una richiesta di gruppo ("1. testo" o "1) testo")
+_NUMBERED_LINE_RE = re.compile(r'^(\d+)[.)]\s*(.+)')
+
+# Stima grossolana dei token del prompt: circa 4 caratteri per token
+_CHARS_PER_TOKEN = 4
+
 
 class AsyncTranslator:
     """Traduttore asincrono con caching e parallelizzazione"""
     
     def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", 
                  max_concurrent: int = 5, use_cache: bool = True,
-                 tm_path: Optional[str] = None):
+                 tm_path: Optional[str] = None, prompts_per_request: int = 1,
+                 max_rpm: Optional[int] = None, max_tpm: Optional[int] = None):
         """
         Inizializza il traduttore asincrono
         
@@ -30,18 +38,31 @@ class AsyncTranslator:
             max_concurrent: Numero massimo di richieste concorrenti
             use_cache: Se utilizzare la Translation Memory
             tm_path: Path del database TM (opzionale)
+            prompts_per_request: Testi inviati in una stessa richiesta (1 = una richiesta per testo)
+            max_rpm: Limite di richieste al minuto (None = nessun limite)
+            max_tpm: Limite di token al minuto (None = nessun limite)
         """
         self.client = AsyncOpenAI(api_key=api_key)
         self.model = model
         self.max_concurrent = max_concurrent
         self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.prompts_per_request = max(1, prompts_per_request)
+        
+        # Limiti al minuto applicati prima dell'invio (capacità che si ricarica nel tempo)
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self._request_capacity = float(max_rpm or 0)
+        self._token_capacity = float(max_tpm or 0)
+        self._capacity_updated = time.monotonic()
         self.use_cache = use_cache
         self.tm = TranslationMemory(tm_path) if use_cache else None
         
         # Statistiche
         self.stats = {
             'cache_hits': 0,
-            'api_calls': 0,
+            'api_calls': 0,  # Richieste inviate all'API (una per gruppo)
+            'api_translations': 0,  # Testi tradotti dall'API
+            'group_fallbacks': 0,  # Gruppi ritradotti con richieste singole
             'total_time': 0,
             'tokens_used': 0
         }
@@ -72,6 +93,7 @@ class AsyncTranslator:
         
         # Prepara i task di traduzione
         translation_tasks = []
+        grouped_indices = []
         results = [None] * len(texts)
         
         for i, text in enumerate(texts):
@@ -83,16 +105,35 @@ class AsyncTranslator:
                     self.stats['cache_hits'] += 1
                     logger.debug(f"Cache hit per: {text[:50]}...")
                     continue
+            
+            # Testi su una sola riga: accorpati in richieste di gruppo (la risposta
+            # numerata si separa per righe)
+            if self.prompts_per_request > 1 and '\n' not in text:
+                grouped_indices.append(i)
+                continue
                     
             # Crea task asincrono per traduzione
             task = self._create_translation_task(
                 i, text, target_language, source_language, context
             )
             translation_tasks.append(task)
+        
+        group_tasks = [
+            self._create_group_translation_task(
+                grouped_indices[start:start + self.prompts_per_request], texts,
+                target_language, source_language, context
+            )
+            for start in range(0, len(grouped_indices), self.prompts_per_request)
+        ]
             
         # Esegui traduzioni in parallelo
-        if translation_tasks:
-            completed_translations = await asyncio.gather(*translation_tasks)
+        if translation_tasks or group_tasks:
+            completed = await asyncio.gather(*translation_tasks, *group_tasks)
+            
+            # I task singoli restituiscono (indice, traduzione), quelli di gruppo una lista
+            completed_translations = completed[:len(translation_tasks)]
+            for group in completed[len(translation_tasks):]:
+                completed_translations.extend(group)
             
             # Inserisci risultati e aggiorna cache
             for idx, translation in completed_translations:
@@ -127,33 +168,98 @@ class AsyncTranslator:
         Returns:
             Tupla (indice, traduzione)
         """
-        async with self.semaphore:  # Limita concorrenza
-            try:
-                translation = await self._translate_single_async(
-                    text, target_language, source_language, context
-                )
-                return (index, translation)
-            except Exception as e:
-                logger.error(f"Errore nella traduzione di '{text[:50]}...': {e}")
-                return (index, text)  # Ritorna originale in caso di errore
+        try:
+            translation = await self._translate_single_async(
+                text, target_language, source_language, context
+            )
+            return (index, translation)
+        except Exception as e:
+            logger.error(f"Errore nella traduzione di '{text[:50]}...': {e}")
+            return (index, text)  # Ritorna originale in caso di errore
                 
-    async def _translate_single_async(self, text: str, target_language: str,
-                                    source_language: Optional[str] = None,
-                                    context: Optional[str] = None) -> str:
+    async def _create_group_translation_task(self, indices: List[int], texts: List[str],
+                                           target_language: str,
+                                           source_language: Optional[str],
+                                           context: Optional[str]) -> List[Tuple[int, str]]:
         """
-        Traduce un singolo testo in modo asincrono
+        Crea un task che traduce più testi con una sola richiesta
+        
+        Se la risposta non contiene una traduzione per ogni testo, il gruppo
+        viene ritradotto con richieste singole.
         
         Args:
-            text: Testo da tradurre
-            target_language: Lingua di destinazione
-            source_language: Lingua di origine
+            indices: Indici dei testi nella lista originale
+            texts: Lista originale dei testi
+            target_language: Lingua target
+            source_language: Lingua sorgente
             context: Contesto
             
         Returns:
-            Testo tradotto
+            Lista di tuple (indice, traduzione)
+        """
+        if len(indices) > 1:
+            try:
+                translations = await self._translate_group_async(
+                    [texts[i] for i in indices], target_language, source_language, context
+                )
+                return list(zip(indices, translations))
+            except Exception as e:
+                logger.warning(f"Traduzione di gruppo fallita ({len(indices)} testi), uso richieste singole: {e}")
+                self.stats['group_fallbacks'] += 1
+        
+        return list(await asyncio.gather(*(
+            self._create_translation_task(i, texts[i], target_language, source_language, context)
+            for i in indices
+        )))
+        
+    async def _wait_for_capacity(self, messages: List[Dict[str, str]], max_tokens: int) -> None:
         """
-        self.stats['api_calls'] += 1
+        Attende che i limiti al minuto consentano una nuova richiesta
+        
+        La capacità di richieste e token si ricarica in modo continuo (max_rpm e
+        max_tpm ogni 60 secondi) e viene consumata prima dell'invio, così non si
+        arriva agli errori 429 del server. Va chiamata prima di occupare uno slot
+        del semaforo: chi attende capacità non blocca le richieste già autorizzate.
         
+        Args:
+            messages: Messaggi della richiesta (per la stima dei token del prompt)
+            max_tokens: Token massimi di risposta richiesti
+        """
+        if not self.max_rpm and not self.max_tpm:
+            return
+        
+        tokens = sum(len(message['content']) for message in messages) // _CHARS_PER_TOKEN + max_tokens
+        if self.max_tpm:
+            tokens = min(tokens, self.max_tpm)  # Una richiesta più grande del limite attende il pieno
+        
+        while True:
+            now = time.monotonic()
+            elapsed = now - self._capacity_updated
+            self._capacity_updated = now
+            if self.max_rpm:
+                self._request_capacity = min(self.max_rpm, self._request_capacity + self.max_rpm * elapsed / 60)
+            if self.max_tpm:
+                self._token_capacity = min(self.max_tpm, self._token_capacity + self.max_tpm * elapsed / 60)
+            
+            if ((not self.max_rpm or self._request_capacity >= 1) and
+                    (not self.max_tpm or self._token_capacity >= tokens)):
+                if self.max_rpm:
+                    self._request_capacity -= 1
+                if self.max_tpm:
+                    self._token_capacity -= tokens
+                return
+            
+            # Attende il tempo necessario a ricaricare la capacità mancante
+            wait = 0.0
+            if self.max_rpm:
+                wait = max(wait, (1 - self._request_capacity) * 60 / self.max_rpm)
+            if self.max_tpm:
+                wait = max(wait, (tokens - self._token_capacity) * 60 / self.max_tpm)
+            await asyncio.sleep(wait)
+        
+    def _create_system_prompt(self, target_language: str,
+                              source_language: Optional[str] = None) -> str:
+        """Crea il prompt di sistema specifico per la lingua target"""
         source_lang_text = f" from {source_language}" if source_language else ""
         
         # Crea prompt specifico per lingua target per evitare contaminazione
@@ -170,7 +276,11 @@ class AsyncTranslator:
             system_prompt += " Use standard Spanish conventions for all terms."
         
         system_prompt += " Do not include any translation markers or metadata in output."
+        return system_prompt
         
+    def _create_messages(self, system_prompt: str, user_content: str,
+                         context: Optional[str] = None) -> List[Dict[str, str]]:
+        """Crea i messaggi della richiesta (prompt di sistema, contesto, testo)"""
         messages = [{
             "role": "system",
             "content": system_prompt
@@ -184,27 +294,115 @@ class AsyncTranslator:
             
         messages.append({
             "role": "user",
-            "content": f"Translate: {text}"
+            "content": user_content
         })
+        return messages
+        
+    async def _translate_single_async(self, text: str, target_language: str,
+                                    source_language: Optional[str] = None,
+                                    context: Optional[str] = None) -> str:
+        """
+        Traduce un singolo testo in modo asincrono
+        
+        Args:
+            text: Testo da tradurre
+            target_language: Lingua di destinazione
+            source_language: Lingua di origine
+            context: Contesto
+            
+        Returns:
+            Testo tradotto
+        """
+        messages = self._create_messages(
+            self._create_system_prompt(target_language, source_language),
+            f"Translate: {text}", context
+        )
+        max_tokens = len(text) * 2  # Stima conservativa
+        await self._wait_for_capacity(messages, max_tokens)
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=len(text) * 2  # Stima conservativa
-            )
+            async with self.semaphore:  # Limita concorrenza
+                self.stats['api_calls'] += 1
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=max_tokens
+                )
             
             # Aggiorna statistiche token
             if hasattr(response, 'usage'):
                 self.stats['tokens_used'] += response.usage.total_tokens
-                
+            
+            self.stats['api_translations'] += 1
             return response.choices[0].message.content.strip()
             
         except Exception as e:
             logger.error(f"Errore API OpenAI: {e}")
             raise
             
+    async def _translate_group_async(self, texts: List[str], target_language: str,
+                                   source_language: Optional[str] = None,
+                                   context: Optional[str] = None) -> List[str]:
+        """
+        Traduce più testi (su una sola riga) con una sola richiesta numerata
+        
+        Args:
+            texts: Testi da tradurre
+            target_language: Lingua di destinazione
+            source_language: Lingua di origine
+            context: Contesto
+            
+        Returns:
+            Testi tradotti, nello stesso ordine
+            
+        Raises:
+            ValueError: se le righe numerate della risposta non sono esattamente 1..N in ordine
+        """
+        count = len(texts)
+        system_prompt = self._create_system_prompt(target_language, source_language)
+        system_prompt += (
+            f" Translate each numbered segment separately and return exactly {count} lines,"
+            f" numbered 1 to {count} in the same order."
+        )
+        numbered = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+        messages = self._create_messages(system_prompt, f"Translate:\n{numbered}", context)
+        max_tokens = sum(map(len, texts)) * 2 + 10 * count  # Stima conservativa + numerazione
+        await self._wait_for_capacity(messages, max_tokens)
+        
+        try:
+            async with self.semaphore:  # Limita concorrenza
+                self.stats['api_calls'] += 1
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=max_tokens
+                )
+            
+            if hasattr(response, 'usage'):
+                self.stats['tokens_used'] += response.usage.total_tokens
+                
+        except Exception as e:
+            logger.error(f"Errore API OpenAI: {e}")
+            raise
+        
+        numbers = []
+        translations = []
+        for line in response.choices[0].message.content.strip().split('\n'):
+            match = _NUMBERED_LINE_RE.match(line.strip())
+            if match:
+                numbers.append(int(match.group(1)))
+                translations.append(match.group(2).strip())
+        
+        # Non basta il conteggio: un elemento saltato più una riga numerata in più
+        # (nota, traduzione spezzata) disallineerebbe tutte le traduzioni successive
+        if numbers != list(range(1, count + 1)):
+            raise ValueError(f"attese traduzioni numerate da 1 a {count}, ricevute {numbers}")
+        
+        self.stats['api_translations'] += count
+        return translations
+            
     async def translate_with_terminology(self, texts: List[str], 
                                        terminology: Dict[str, str],
                                        target_language: str,
@@ -287,10 +485,12 @@ class AsyncTranslator:
         
         if stats['api_calls'] > 0:
             stats['avg_time_per_call'] = stats['total_time'] / stats['api_calls']
-            stats['cache_hit_rate'] = stats['cache_hits'] / (stats['cache_hits'] + stats['api_calls'])
         else:
             stats['avg_time_per_call'] = 0
-            stats['cache_hit_rate'] = 0
+        
+        # Rapporto sui testi, non sulle richieste: un gruppo conta per i testi che contiene
+        looked_up = stats['cache_hits'] + stats['api_translations']
+        stats['cache_hit_rate'] = stats['cache_hits'] / looked_up if looked_up else 0
             
         if self.tm:
             stats['tm_stats'] = self.tm.get_statistics()
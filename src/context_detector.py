@@ -5,6 +5,13 @@ Context Detector - Rileva automaticamente il tipo di documento e contesto per mi
 import re
 from typing import Dict, List, Optional, Tuple
 from collections import Counter
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _keyword_pattern(keyword: str) -> re.Pattern:
+    """Regex (parola intera) di una keyword, compilata una sola volta per processo"""
+    return re.compile(r'\b' + re.escape(keyword.lower()) + r'\b')
 
 
 class DocumentContextDetector:
@@ -139,7 +146,7 @@ class DocumentContextDetector:
             total_keywords = len(keywords)
             
             for keyword in keywords:
-                keyword_count += len(re.findall(r'\b' + re.escape(keyword.lower()) + r'\b', all_text))
+                keyword_count += len(_keyword_pattern(keyword).findall(all_text))
             
             # Calcola il punteggio normalizzato
             # Considera sia la frequenza che la varietà delle keyword trovate
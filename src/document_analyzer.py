@@ -67,12 +67,16 @@ class DocumentAnalyzer:
         for story_name, story_data in stories_data.items():
             story_root = story_data['root']
             
-            # Estrai tutto il testo, anche quello che normalmente non sarebbe tradotto
+            # Estrai tutto il testo, anche quello che normalmente non sarebbe tradotto.
+            # isspace() scarta l'indentazione senza allocare: strip() solo sui testi tenuti
             for elem in story_root.iter():
-                if elem.text and elem.text.strip():
-                    all_texts.append(elem.text.strip())
-                if elem.tail and elem.tail.strip():
-                    all_texts.append(elem.tail.strip())
+                # Salta il testo di commenti e Processing Instructions
+                text = elem.text
+                if text and isinstance(elem.tag, str) and not text.isspace():
+                    all_texts.append(text.strip())
+                tail = elem.tail
+                if tail and not tail.isspace():
+                    all_texts.append(tail.strip())
         
         return all_texts
     
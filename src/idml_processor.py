@@ -2,16 +2,407 @@
 IDML Processor - Gestisce l'apertura, manipolazione e salvataggio di file IDML
 """
 
+import io
 import os
 import re
+import shutil
+import sys
 import tempfile
+import threading
 import zipfile
+from collections import Counter
+from copy import copy
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
-from xml.etree import ElementTree as ET
-
+from typing import Dict, List, Optional, Tuple, Any, BinaryIO, Iterator
+from lxml import etree as ET
 from simple_idml import idml
 
+try:
+    from text_extractor import TextExtractor
+except ImportError:
+    # Import come package (es. src.idml_processor)
+    from .text_extractor import TextExtractor
+
+
+# Pattern per identificare tag malformati nell'XML serializzato
+_MALFORMED_PATTERNS = (
+    r'<(?![/\w])',  # Tag che non iniziano con lettera o /
+    r'<[^>]*[<>][^>]*>',  # Tag con < o > interni
+    r'<\s+\w+',  # Tag con spazi iniziali
+    r'<\w+[^>]*\s+>$',  # Tag con spazi finali prima della chiusura
+    r'<\w+.*?(?<!/)>\s*$',  # Tag non auto-chiusi senza contenuto
+)
+
+# Compilati una volta sola: un passaggio per pattern, perché le corrispondenze di
+# pattern diversi possono sovrapporsi e vanno riportate tutte
+_MALFORMED_REGEXES = tuple(
+    (pattern, re.compile(pattern, re.MULTILINE)) for pattern in _MALFORMED_PATTERNS
+)
+
+# Suffissi degli stili di default di InDesign, esclusi dal conteggio degli stili inutilizzati
+_NORMAL_PARAGRAPH_STYLE_SUFFIX = '/NormalParagraphStyle'
+_NORMAL_CHARACTER_STYLE_SUFFIX = '/NormalCharacterStyle'
+
+# Parser condiviso: nessuna normalizzazione di spazi o CDATA per preservare la fedeltà IDML.
+# huge_tree evita i limiti di sicurezza di libxml2 su stories e spread molto grandi;
+# collect_ids=False salta la tabella degli xml:id, che IDML non usa (i riferimenti sono "Self")
+_PARSER_OPTIONS = dict(remove_blank_text=False, strip_cdata=False, huge_tree=True, collect_ids=False)
+_XML_PARSER = ET.XMLParser(**_PARSER_OPTIONS)
+
+# Parser per thread: lxml serializza l'uso di un parser condiviso, quindi il
+# parsing parallelo ne usa uno per ogni thread del pool
+_thread_local = threading.local()
+
+# Filtri tag per iter()/iterparse di lxml: il confronto avviene in C, in qualsiasi
+# namespace o senza (negli IDML gli elementi interni non hanno namespace)
+_CONTENT_MATCH = '{*}Content'
+_TEXTFRAME_MATCH = '{*}TextFrame'
+_LINK_MATCH = '{*}Link'
+_LINKED_GRAPHIC_MATCHES = ('{*}Image', '{*}Rectangle', '{*}Polygon', '{*}GraphicLine')
+_XML_ELEMENT_MATCH = '{*}XMLElement'
+_XML_TAG_MATCH = '{*}XMLTag'
+_STYLE_MATCHES = ('{*}ParagraphStyle', '{*}CharacterStyle')
+_STYLE_RANGE_MATCHES = ('{*}ParagraphStyleRange', '{*}CharacterStyleRange')
+
+# XPath precompilata per la sostituzione del testo nelle stories (valutata da libxml2):
+# i CharacterStyleRange nello stesso ordine di iter()
+_CSR_XPATH = ET.XPath(".//*[local-name()='CharacterStyleRange']")
+
+# Elementi (root compresa) con attributo TrackChanges
+_TRACK_CHANGES_XPATH = ET.XPath("descendant-or-self::*[@TrackChanges]")
+
+# Nodi di testo non di sola spaziatura di una story, in ordine di documento
+# (esclusi il contenuto di commenti e PI); stringhe semplici, senza riferimenti all'albero
+_TEXT_NODES_XPATH = ET.XPath(".//text()[normalize-space()]", smart_strings=False)
+
+# Vero se un TextFrame contiene testo non di sola spaziatura (o PI/commenti, che
+# iter() include): negli spread quasi mai, e libxml2 lo verifica senza visitare
+# i discendenti in Python
+_FRAME_HAS_TEXT_XPATH = ET.XPath(
+    "boolean(.//text()[normalize-space()] | .//processing-instruction() | .//comment())"
+)
+
+# Mappa codici lingua -> AppliedLanguage IDML
+_LANGUAGE_MAP = {
+    'de': '$ID/German',
+    'en': '$ID/English', 
+    'es': '$ID/Spanish',
+    'fr': '$ID/French',
+    'it': '$ID/Italian'
+}
+
+# Attributi di un TextFrame che possono indicare la dimensione del font
+_FRAME_FONT_SIZE_ATTRS = ('FontSize', 'PointSize')
+
+# Marcatori di numerazione pagine dinamica
+_PAGE_MARKERS = (
+    '<#>',  # Numero pagina corrente
+    '<!#>',  # Numero pagina precedente  
+    '<$>',   # Numero pagina successiva
+    '<Auto Page Number>',
+    'CurrentPageNumber',
+    'NextPageNumber',
+    'PreviousPageNumber'
+)
+_PAGE_MARKER_RE = re.compile('|'.join(map(re.escape, _PAGE_MARKERS)))
+
+# Caratteri degli identificatori senza lettere (es. "0042", "12_34") nelle master pages
+_IDENT_NO_ALPHA_CHARS = '0123456789_'
+
+# Dimensione dei blocchi per la copia in streaming delle entry non modificate
+_COPY_BUFFER_SIZE = 128 * 1024
+
+# Livello DEFLATE per le parti riscritte: il livello 1 dimezza circa il tempo
+# di compressione rispetto al default (6) con un aumento minimo delle dimensioni
+_DEFAULT_COMPRESSLEVEL = 1
+
+# Sentinella per lookup su dizionari dove None è un valore valido
+_MISSING = object()
+
+# Attributi che se presenti su uno style range indicano un override locale
+_PARAGRAPH_OVERRIDES = frozenset({'PointSize', 'Leading', 'Justification', 'LeftIndent', 'RightIndent'})
+_CHARACTER_OVERRIDES = frozenset({'FontStyle', 'PointSize', 'FillColor', 'BaselineShift', 'Tracking'})
+_OVERRIDE_INDICATORS = {
+    'paragraph': _PARAGRAPH_OVERRIDES,
+    'character': _CHARACTER_OVERRIDES
+}
+
+# Tag IDML critici da validare
+_CRITICAL_TAGS = {
+    'Br': 'Line breaks',
+    'Tab': 'Tab characters',
+    'Content': 'Text content',
+    'CharacterStyleRange': 'Character formatting',
+    'ParagraphStyleRange': 'Paragraph formatting',
+    'TextFrame': 'Text containers',
+    'Rectangle': 'Graphic containers',
+    'Image': 'Images',
+    'Link': 'Resource links'
+}
+
+# Per ogni tag critico: regex dei tag di apertura, di chiusura e auto-chiusi
+_TAG_BALANCE_REGEXES = tuple(
+    (tag_name,
+     re.compile(f'<{tag_name}[^>]*(?<!/)>'),
+     re.compile(f'</{tag_name}>'),
+     re.compile(f'<{tag_name}[^>]*/>'))
+    for tag_name in _CRITICAL_TAGS
+)
+
+# Numero massimo di thread per il parsing parallelo di stories, spread e master spread
+_MAX_PARSE_WORKERS = 8
+
+# Valori proposti da generate_overflow_adjustments per le strategie di riduzione
+_REDUCED_INSET_SPACING = (3.0, 3.0, 3.0, 3.0)  # Margini ridotti
+_REDUCED_FONT_SIZE = 11.0  # Da 12.0 default
+_REDUCED_LEADING = 13.2  # Proporzionale
+
+# Voci base della checklist DTP (copiate ed estese in generate_dtp_checklist)
+_CRITICAL_CHECKS_BASE = (
+    "Aprire il file IDML tradotto in InDesign per verificare che si apra senza errori",
+    "Controllare che tutto il testo sia visibile e non ci siano overflow (testo che fuoriesce dai frame)",
+    "Verificare che la formattazione (grassetto, corsivo, colori) sia preservata",
+    "Controllare l'allineamento del testo e la spaziatura tra paragrafi",
+    "Verificare che i numeri di pagina (se presenti) siano corretti",
+)
+
+_RECOMMENDED_CHECKS_BASE = (
+    "Controllare che le immagini e i grafici siano ancora collegati correttamente",
+    "Verificare che i link ipertestuali (se presenti) funzionino ancora",
+    "Controllare la consistenza degli stili in tutto il documento",
+    "Verificare che i margini e le spaziature siano appropriate per la lingua di destinazione",
+    "Controllare che non ci siano caratteri orfani o vedove in posizioni critiche",
+)
+
+_OPTIONAL_CHECKS_BASE = (
+    "Ottimizzare la disposizione del testo per una migliore leggibilità nella lingua di destinazione",
+    "Considerare modifiche culturali nella presentazione (colori, simboli, layout)",
+    "Verificare che le abbreviazioni e i formati numerici siano appropriati per la regione",
+    "Controllare la coerenza terminologica in tutto il documento",
+)
+
+# Note specifiche per lingua della checklist DTP
+_LANGUAGE_NOTES: Dict[str, Tuple[str, ...]] = {
+    'de': (
+        "Il tedesco tende ad espandersi del 20-30% - verificare overflow",
+        "Controllare la composizione delle parole composte lunghe",
+        "Verificare l'uso corretto delle maiuscole per i sostantivi"
+    ),
+    'fr': (
+        "Il francese tende ad espandersi del 15-20% - verificare overflow", 
+        "Controllare gli spazi prima dei due punti e punti interrogativi",
+        "Verificare l'uso corretto degli accenti"
+    ),
+    'es': (
+        "Lo spagnolo tende ad espandersi del 15-25% - verificare overflow",
+        "Controllare l'uso dei segni di interrogazione e esclamazione invertiti",
+        "Verificare la concordanza di genere negli aggettivi"
+    ),
+    'it': (
+        "L'italiano ha espansione moderata del 10-15%",
+        "Controllare l'uso corretto degli apostrofi",
+        "Verificare gli accenti sulle parole tronche"
+    ),
+    'zh': (
+        "Verificare che tutti i caratteri cinesi siano visualizzati correttamente",
+        "Controllare la direzione del testo e l'allineamento",
+        "Verificare che non ci siano caratteri mancanti (□)"
+    ),
+    'ja': (
+        "Verificare mixing di hiragana, katakana e kanji",
+        "Controllare la direzione del testo (orizzontale vs verticale)",
+        "Verificare la punteggiatura giapponese"
+    ),
+    'ar': (
+        "CRITICO: Verificare la direzione RTL (destra-sinistra)",
+        "Controllare che la forma delle lettere arabe sia corretta nel contesto",
+        "Verificare l'allineamento del testo RTL"
+    ),
+    'he': (
+        "CRITICO: Verificare la direzione RTL (destra-sinistra)",
+        "Controllare la punteggiatura ebraica",
+        "Verificare l'allineamento del testo RTL"
+    )
+}
+
+
+@lru_cache(maxsize=512)
+def _strip_namespace(tag: Any) -> str:
+    """
+    Rimuove il namespace da un tag XML (stringa vuota per commenti e PI).
+    
+    I tag IDML sono poche decine di stringhe distinte: il risultato viene
+    memorizzato, così le visite dell'albero non allocano una stringa per nodo.
+    """
+    if not isinstance(tag, str):
+        return ''
+    i = tag.find('}')
+    return tag[i + 1:] if i >= 0 else tag
+
+
+@lru_cache(maxsize=1024)
+def _parse_float_values(value: str) -> Tuple[float, ...]:
+    """
+    Converte una lista di numeri separati da spazi (es. inset) in float.
+    
+    Molti frame condividono le stesse stringhe (es. inset "0 0 0 0"): il risultato
+    viene memorizzato per stringa. Non usarla per valori unici per frame, che
+    riempirebbero la cache senza mai colpirla.
+    """
+    return tuple(map(float, value.split()))
+
+
+def _try_parse_xml(content: bytes) -> Tuple[Optional[ET.Element], Optional[Exception]]:
+    """
+    Parsa XML con il parser del thread corrente (per l'uso in un ThreadPoolExecutor).
+    
+    Returns:
+        Tupla (root, None) oppure (None, eccezione) se il parsing fallisce
+    """
+    parser = getattr(_thread_local, 'parser', None)
+    if parser is None:
+        parser = _thread_local.parser = ET.XMLParser(**_PARSER_OPTIONS)
+    try:
+        return ET.fromstring(content, parser), None
+    except Exception as e:
+        return None, e
+
+
+def _release_element(element: ET.Element) -> None:
+    """Libera un elemento già elaborato durante iterparse e i fratelli precedenti"""
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def _is_dynamic_page_number_text(text: str) -> bool:
+    """Identifica marcatori di numerazione pagine dinamici"""
+    # Controlla se contiene marker di pagina (una sola scansione)
+    if _PAGE_MARKER_RE.search(text):
+        return True
+    
+    # Controlla se è un numero isolato che potrebbe essere dinamico
+    return len(text) <= 3 and text.isdigit()
+
+
+@lru_cache(maxsize=4096)
+def _classify_master_text(text_clean: str) -> Optional[str]:
+    """
+    Classifica un testo (già ripulito) di master page.
+    
+    Header, footer e titoli correnti si ripetono su molti spread: il risultato
+    viene memorizzato per testo.
+    
+    Returns:
+        'dynamic_page_number', 'translatable_text' oppure None (da ignorare)
+    """
+    # Marker tecnici di numerazione pagine
+    if _is_dynamic_page_number_text(text_clean):
+        return 'dynamic_page_number'
+    
+    # Per il resto la stessa logica del text extractor ma più permissiva
+    if len(text_clean) < 2:
+        return None
+    
+    # Non tradurre solo punteggiatura: nessun carattere di parola (\w) né spazio.
+    # Per il testo ordinario any() si ferma al primo carattere
+    if not any(c.isalnum() or c == '_' or c.isspace() for c in text_clean):
+        return None
+    
+    # Non tradurre identificatori puri senza lettere (ma permetti parole: le sigle
+    # maiuscole come "NOTE" o "ISBN" restano traducibili)
+    if len(text_clean) >= 4 and not text_clean.strip(_IDENT_NO_ALPHA_CHARS):
+        return None
+    
+    return 'translatable_text'
+
+
+def _validate_story(story_path: str, story_xml: str, story_root: Optional[ET.Element] = None) -> Dict[str, Any]:
+    """
+    Valida l'integrità XML di una singola story.
+    
+    Args:
+        story_path: Path della story nel package IDML
+        story_xml: XML serializzato della story
+        story_root: Root già parsata (se None viene ricavata da story_xml)
+        
+    Returns:
+        Risultati parziali della validazione per la story
+    """
+    result = {
+        'is_valid': True,
+        'errors': [],
+        'warnings': [],
+        'tag_counts': {},
+        'broken_tags': []
+    }
+    
+    try:
+        if story_root is None:
+            story_root = ET.fromstring(story_xml, _XML_PARSER)
+        
+        # Conta tag utilizzati
+        for tag_name in _CRITICAL_TAGS:
+            result['tag_counts'][tag_name] = story_xml.count(f'<{tag_name}')
+        
+        # Rileva tag malformati
+        for pattern, regex in _MALFORMED_REGEXES:
+            matches = regex.findall(story_xml)
+            if matches:
+                result['broken_tags'].append({
+                    'story': story_path,
+                    'pattern': pattern,
+                    'matches': matches[:5],  # Primi 5 per non sovraccaricare
+                    'description': f'Tag malformati trovati in {story_path}'
+                })
+        
+        # Verifica bilancio tag apertura/chiusura per tag critici
+        for tag_name, opening_re, closing_re, self_closing_re in _TAG_BALANCE_REGEXES:
+            opening_tags = len(opening_re.findall(story_xml))
+            closing_tags = len(closing_re.findall(story_xml))
+            self_closing = len(self_closing_re.findall(story_xml))
+            
+            # I tag auto-chiusi sono bilanciati per definizione
+            expected_closing = opening_tags - self_closing
+            
+            if expected_closing != closing_tags and expected_closing > 0:
+                result['errors'].append(
+                    f"Tag sbilanciati in {story_path}: {tag_name} "
+                    f"aperti={opening_tags}, chiusi={closing_tags}, auto-chiusi={self_closing}"
+                )
+                result['is_valid'] = False
+        
+        # Verifica attributi critici
+        for elem in story_root.iter(ET.Element):
+            elem_tag = _strip_namespace(elem.tag)
+            
+            # Verifica attributi Self per unicità
+            if 'Self' in elem.attrib:
+                self_value = elem.get('Self')
+                if not self_value or len(self_value) < 3:
+                    result['warnings'].append(
+                        f"Attributo Self vuoto o troppo corto in {story_path}: {elem_tag}"
+                    )
+            
+            # Verifica attributi stile
+            if elem_tag in ['CharacterStyleRange', 'ParagraphStyleRange']:
+                style_attr = 'AppliedCharacterStyle' if elem_tag == 'CharacterStyleRange' else 'AppliedParagraphStyle'
+                if style_attr not in elem.attrib:
+                    result['warnings'].append(
+                        f"Attributo stile mancante in {story_path}: {elem_tag} senza {style_attr}"
+                    )
+    
+    except ET.ParseError as e:
+        result['errors'].append(f"Errore parsing XML in {story_path}: {e}")
+        result['is_valid'] = False
+    except Exception as e:
+        result['warnings'].append(f"Errore validazione {story_path}: {e}")
+    
+    return result
+
 
 class IDMLProcessor:
     """Classe per processare file IDML di InDesign"""
@@ -30,6 +421,18 @@ class IDMLProcessor:
         self.backing_story_data = {}
         self.xml_structure = {}
         self.temp_dir = None
+        self._story_by_id = {}
+        self._package_names = set()
+        self._xml_files_by_folder: Dict[str, List[str]] = {}
+        self._read_cache: Dict[str, bytes] = {}
+        # Stories modificate (traduzioni, lingua): solo queste vengono riserializzate
+        self._modified_stories = set()
+        self.spread_cache: Dict[str, ET.Element] = {}
+        self._master_content_cache: Optional[Dict[str, Any]] = None
+        
+        # Extractor condiviso per applicare in sostituzione la stessa logica di filtraggio
+        # dell'estrazione (la sua cache dei risultati resta valida tra le chiamate)
+        self._text_extractor = TextExtractor()
         
         if not self.idml_path.exists():
             raise FileNotFoundError(f"File IDML non trovato: {idml_path}")
@@ -37,38 +440,107 @@ class IDMLProcessor:
     def load_idml(self) -> None:
         """Carica il file IDML in memoria"""
         try:
+            # Ricaricamento: chiude l'handle del package precedente
+            if self.idml_package is not None:
+                self.idml_package.close()
+            
             self.idml_package = idml.IDMLPackage(str(self.idml_path))
+            self._read_cache = {}
+            self._modified_stories = set()
+            self._index_package_files()
             
-            # Verifica Track Changes sia disattivato
+            self._extract_stories()
+            
+            # Verifica Track Changes sia disattivato (sulle stories appena parsate)
             self._validate_track_changes()
             
-            self._extract_stories()
+            # Da qui in poi le stories vivono solo negli alberi: i byte sorgente
+            # (la save copia dal package le entry non modificate) non servono più
+            for story_path in self.stories_data:
+                self._read_cache.pop(story_path, None)
             
             # Carica BackingStory e struttura XML se presente
             self._load_backing_story()
         except Exception as e:
             raise RuntimeError(f"Errore nel caricamento IDML: {e}")
     
+    def _index_package_files(self) -> None:
+        """
+        Indicizza una sola volta il catalogo del package
+        
+        - nomi delle entry, per verifiche di presenza O(1)
+        - file XML per cartella (es: "Spreads" -> ["Spreads/Spread_u1.xml", ...])
+        - stories per id (es: "u16a" -> "Stories/Story_u16a.xml")
+        """
+        self._package_names = set()
+        self._xml_files_by_folder = {}
+        self._story_by_id = {}
+        
+        for info in self.idml_package.infolist():
+            filename = info.filename
+            self._package_names.add(filename)
+            
+            folder, sep, name = filename.partition('/')
+            if sep and filename.endswith('.xml'):
+                self._xml_files_by_folder.setdefault(folder, []).append(filename)
+            
+            if folder == 'Stories' and name.startswith('Story_'):
+                # Slicing invece di removeprefix/removesuffix (Python 3.9+): si supporta il 3.8
+                story_id = name[len('Story_'):]
+                if story_id.endswith('.xml'):
+                    story_id = story_id[:-len('.xml')]
+                self._story_by_id[story_id] = filename
+    
+    def _read(self, name: str) -> bytes:
+        """
+        Legge (decomprimendola una sola volta) una entry del package
+        
+        Spread e master spread vengono letti da più passaggi (master pages, analisi
+        frame, modifiche): i byte originali restano in cache finché non vengono
+        parsati in spread_cache o elaborati in _master_content_cache. Quelli delle
+        stories servono solo durante load_idml e vengono rilasciati una volta parsate.
+        Il package non viene mai riscritto, quindi la cache non va invalidata: le
+        modifiche vivono negli alberi XML.
+        """
+        content = self._read_cache.get(name)
+        if content is None:
+            content = self._read_cache[name] = self.idml_package.read(name)
+        return content
+    
+    def get_xml_files(self, folder: str) -> List[str]:
+        """
+        Restituisce i file XML di una cartella del package, in ordine di archivio
+        
+        Args:
+            folder: Cartella di primo livello (es: "Spreads", "MasterSpreads")
+        """
+        return list(self._xml_files_by_folder.get(folder, ()))
+    
     def _extract_stories(self) -> None:
         """Estrae le stories (contenuti testuali) dal file IDML"""
         stories_list = self.idml_package.stories
         
+        # Legge le stories in sequenza (ZipFile non è thread-safe)...
+        story_contents = {}
         for story_path in stories_list:
             try:
-                # Ottieni il contenuto della story usando il path
-                story_content = self.idml_package.read(story_path)
-                if isinstance(story_content, bytes):
-                    story_content = story_content.decode('utf-8')
-                
-                # Parse XML content
-                story_root = ET.fromstring(story_content)
-                self.stories_data[story_path] = {
-                    'root': story_root,
-                    'original_content': story_content
-                }
-            except (ET.ParseError, Exception) as e:
+                story_contents[story_path] = self._read(story_path)
+            except Exception as e:
                 print(f"Warning: Errore parsing story {story_path}: {e}")
+        
+        # ...e le parsa in parallelo se ci sono più core: lxml rilascia il GIL
+        workers = min(_MAX_PARSE_WORKERS, os.cpu_count() or 1, len(story_contents))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_try_parse_xml, story_contents.values()))
+        else:
+            results = list(map(_try_parse_xml, story_contents.values()))
+        
+        for (story_path, story_content), (story_root, error) in zip(story_contents.items(), results):
+            if error is not None:
+                print(f"Warning: Errore parsing story {story_path}: {error}")
                 continue
+            self.stories_data[story_path] = {'root': story_root}
     
     def _validate_track_changes(self) -> None:
         """
@@ -80,10 +552,8 @@ class IDMLProcessor:
         # Controlla le preferences del documento
         try:
             preferences_content = self.idml_package.read('Resources/Preferences.xml')
-            if isinstance(preferences_content, bytes):
-                preferences_content = preferences_content.decode('utf-8')
             
-            pref_root = ET.fromstring(preferences_content)
+            pref_root = ET.fromstring(preferences_content, _XML_PARSER)
             
             # Cerca impostazioni Track Changes nelle preferences
             for elem in pref_root.iter():
@@ -97,17 +567,20 @@ class IDMLProcessor:
         # Controlla ogni story per Track Changes attivo
         for story_path in self.idml_package.stories:
             try:
-                story_content = self.idml_package.read(story_path)
-                if isinstance(story_content, bytes):
-                    story_content = story_content.decode('utf-8')
+                story_content = self._read(story_path)
                 
                 # Cerca attributi TrackChanges nella story
-                if 'TrackChanges="true"' in story_content:
+                if b'TrackChanges="true"' in story_content:
                     track_changes_found.append(f"Story: {story_path}")
                     
-                # Parse XML per controllo più accurato
-                story_root = ET.fromstring(story_content)
-                for elem in story_root.iter():
+                # Controllo più accurato sull'albero già caricato da _extract_stories
+                # (parse solo se la story non è stata caricata)
+                story_data = self.stories_data.get(story_path)
+                if story_data is not None:
+                    story_root = story_data['root']
+                else:
+                    story_root = ET.fromstring(story_content, _XML_PARSER)
+                for elem in _TRACK_CHANGES_XPATH(story_root):
                     if elem.get('TrackChanges', '').lower() == 'true':
                         track_changes_found.append(f"Story {story_path}: elemento {elem.tag}")
                         
@@ -179,16 +652,14 @@ class IDMLProcessor:
         try:
             # Leggi il file Fonts.xml
             fonts_content = self.idml_package.read('Resources/Fonts.xml')
-            if isinstance(fonts_content, bytes):
-                fonts_content = fonts_content.decode('utf-8')
             
-            fonts_root = ET.fromstring(fonts_content)
+            fonts_root = ET.fromstring(fonts_content, _XML_PARSER)
             
             # Cerca tutti i font definiti
             for elem in fonts_root.iter():
                 if 'FontFamily' in elem.attrib:
                     document_fonts.add(elem.get('FontFamily'))
-                if 'Name' in elem.attrib and elem.tag.endswith('Font'):
+                if 'Name' in elem.attrib and self._remove_namespace(elem.tag).endswith('Font'):
                     document_fonts.add(elem.get('Name'))
         except Exception as e:
             validation_result['warnings'].append(f"Impossibile leggere definizioni font: {e}")
@@ -281,10 +752,8 @@ class IDMLProcessor:
         try:
             # Leggi il file Links.xml che contiene informazioni sui collegamenti
             links_content = self.idml_package.read('Links.xml')
-            if isinstance(links_content, bytes):
-                links_content = links_content.decode('utf-8')
             
-            links_root = ET.fromstring(links_content)
+            links_root = ET.fromstring(links_content, _XML_PARSER)
             
             # Pattern per identificare file che potrebbero contenere testo
             text_graphic_patterns = [
@@ -294,63 +763,53 @@ class IDMLProcessor:
             ]
             
             # Cerca tutti i Link elements
-            for link_elem in links_root.iter():
-                if self._remove_namespace(link_elem.tag) == 'Link':
-                    link_path = link_elem.get('LinkResourceURI', '')
-                    file_name = link_path.split('/')[-1] if '/' in link_path else link_path
+            for link_elem in links_root.iter(_LINK_MATCH):
+                link_path = link_elem.get('LinkResourceURI', '')
+                file_name = link_path.split('/')[-1] if '/' in link_path else link_path
+                
+                if file_name:
+                    linked_graphics['graphics_found'].append(file_name)
                     
-                    if file_name:
-                        linked_graphics['graphics_found'].append(file_name)
-                        
-                        # Controlla se è un tipo di file che potrebbe contenere testo
-                        file_ext = file_name.lower()
-                        for pattern in text_graphic_patterns:
-                            if file_ext.endswith(pattern):
-                                linked_graphics['potential_text_graphics'].append({
-                                    'file': file_name,
-                                    'type': pattern,
-                                    'path': link_path
-                                })
-                                break
+                    # Controlla se è un tipo di file che potrebbe contenere testo
+                    file_ext = file_name.lower()
+                    for pattern in text_graphic_patterns:
+                        if file_ext.endswith(pattern):
+                            linked_graphics['potential_text_graphics'].append({
+                                'file': file_name,
+                                'type': pattern,
+                                'path': link_path
+                            })
+                            break
         
         except Exception as e:
             linked_graphics['warnings'].append(f"Impossibile analizzare Links.xml: {e}")
         
         # Cerca anche nei Spreads per Rectangle/Image con collegamenti
         try:
-            spread_files = []
-            for file_info in self.idml_package.infolist():
-                if 'Spreads/' in file_info.filename and file_info.filename.endswith('.xml'):
-                    spread_files.append(file_info.filename)
+            spread_files = self.get_xml_files('MasterSpreads') + self.get_xml_files('Spreads')
             
             for spread_file in spread_files:
                 try:
-                    spread_content = self.idml_package.read(spread_file)
-                    if isinstance(spread_content, bytes):
-                        spread_content = spread_content.decode('utf-8')
-                    
-                    spread_root = ET.fromstring(spread_content)
+                    spread_root = self._get_spread_root(spread_file)
                     
                     # Cerca elementi Image o Rectangle con Link
-                    for elem in spread_root.iter():
-                        elem_tag = self._remove_namespace(elem.tag)
-                        if elem_tag in ['Image', 'Rectangle', 'Polygon', 'GraphicLine']:
-                            # Cerca attributi di collegamento
-                            for attr in ['Link', 'LinkResourceURI']:
-                                if attr in elem.attrib:
-                                    link_ref = elem.get(attr)
-                                    if link_ref and link_ref not in [g['path'] for g in linked_graphics['potential_text_graphics']]:
-                                        # Aggiungi se non già presente
-                                        file_name = link_ref.split('/')[-1]
-                                        for pattern in text_graphic_patterns:
-                                            if file_name.lower().endswith(pattern):
-                                                linked_graphics['potential_text_graphics'].append({
-                                                    'file': file_name,
-                                                    'type': pattern,
-                                                    'path': link_ref,
-                                                    'found_in': spread_file
-                                                })
-                                                break
+                    for elem in spread_root.iter(*_LINKED_GRAPHIC_MATCHES):
+                        # Cerca attributi di collegamento
+                        for attr in ['Link', 'LinkResourceURI']:
+                            if attr in elem.attrib:
+                                link_ref = elem.get(attr)
+                                if link_ref and link_ref not in [g['path'] for g in linked_graphics['potential_text_graphics']]:
+                                    # Aggiungi se non già presente
+                                    file_name = link_ref.split('/')[-1]
+                                    for pattern in text_graphic_patterns:
+                                        if file_name.lower().endswith(pattern):
+                                            linked_graphics['potential_text_graphics'].append({
+                                                'file': file_name,
+                                                'type': pattern,
+                                                'path': link_ref,
+                                                'found_in': spread_file
+                                            })
+                                            break
                 
                 except Exception as e:
                     continue
@@ -418,19 +877,14 @@ class IDMLProcessor:
             # Cerca BackingStory.xml nella cartella XML
             backing_story_path = 'XML/BackingStory.xml'
             
-            if backing_story_path not in [f.filename for f in self.idml_package.infolist()]:
+            if backing_story_path not in self._package_names:
                 print("ℹ️  BackingStory.xml non presente (documento senza struttura XML)")
                 return
             
             backing_story_content = self.idml_package.read(backing_story_path)
-            if isinstance(backing_story_content, bytes):
-                backing_story_content = backing_story_content.decode('utf-8')
             
-            backing_story_root = ET.fromstring(backing_story_content)
-            self.backing_story_data = {
-                'root': backing_story_root,
-                'original_content': backing_story_content
-            }
+            backing_story_root = ET.fromstring(backing_story_content, _XML_PARSER)
+            self.backing_story_data = {'root': backing_story_root}
             
             # Analizza la struttura XML
             self._analyze_xml_structure(backing_story_root)
@@ -449,49 +903,46 @@ class IDMLProcessor:
         Mappa elementi XML alle stories corrispondenti.
         """
         # Trova tutti gli XMLElement
-        for elem in backing_story_root.iter():
-            elem_tag = self._remove_namespace(elem.tag)
+        for elem in backing_story_root.iter(_XML_ELEMENT_MATCH):
+            self_id = elem.get('Self', '')
+            markup_tag = elem.get('MarkupTag', '')
+            xml_content = elem.get('XMLContent', '')
+            
+            # Estrai informazioni strutturali
+            element_info = {
+                'id': self_id,
+                'tag': markup_tag,
+                'content_ref': xml_content,
+                'attributes': {},
+                'children': []
+            }
             
-            if elem_tag == 'XMLElement':
-                self_id = elem.get('Self', '')
-                markup_tag = elem.get('MarkupTag', '')
-                xml_content = elem.get('XMLContent', '')
-                
-                # Estrai informazioni strutturali
-                element_info = {
-                    'id': self_id,
-                    'tag': markup_tag,
-                    'content_ref': xml_content,
-                    'attributes': {},
-                    'children': []
-                }
-                
-                # Cerca XMLAttribute figli
-                for child in elem:
-                    child_tag = self._remove_namespace(child.tag)
-                    
-                    if child_tag == 'XMLAttribute':
-                        attr_name = child.get('Name', '')
-                        attr_value = child.get('Value', '')
-                        element_info['attributes'][attr_name] = attr_value
-                    
-                    elif child_tag == 'XMLElement':
-                        # Elemento figlio
-                        child_id = child.get('Self', '')
-                        element_info['children'].append(child_id)
+            # Cerca XMLAttribute figli
+            for child in elem:
+                child_tag = self._remove_namespace(child.tag)
                 
-                # Mappa content_ref alla story corrispondente
-                if xml_content:
-                    # Il content_ref può puntare a una story (es: "u16a" -> "Stories/Story_u16a.xml")
-                    potential_story_path = f"Stories/Story_{xml_content}.xml"
-                    if potential_story_path in self.stories_data:
-                        element_info['story_path'] = potential_story_path
-                        element_info['has_translatable_content'] = True
-                    else:
-                        # Potrebbe essere un riferimento a un altro tipo di contenuto
-                        element_info['has_translatable_content'] = False
+                if child_tag == 'XMLAttribute':
+                    attr_name = child.get('Name', '')
+                    attr_value = child.get('Value', '')
+                    element_info['attributes'][attr_name] = attr_value
                 
-                self.xml_structure[self_id] = element_info
+                elif child_tag == 'XMLElement':
+                    # Elemento figlio
+                    child_id = child.get('Self', '')
+                    element_info['children'].append(child_id)
+            
+            # Mappa content_ref alla story corrispondente
+            if xml_content:
+                # Il content_ref può puntare a una story (es: "u16a" -> "Stories/Story_u16a.xml")
+                potential_story_path = f"Stories/Story_{xml_content}.xml"
+                if potential_story_path in self.stories_data:
+                    element_info['story_path'] = potential_story_path
+                    element_info['has_translatable_content'] = True
+                else:
+                    # Potrebbe essere un riferimento a un altro tipo di contenuto
+                    element_info['has_translatable_content'] = False
+            
+            self.xml_structure[self_id] = element_info
     
     def _load_xml_tags(self) -> None:
         """
@@ -500,28 +951,23 @@ class IDMLProcessor:
         try:
             tags_path = 'XML/Tags.xml'
             
-            if tags_path not in [f.filename for f in self.idml_package.infolist()]:
+            if tags_path not in self._package_names:
                 return
             
             tags_content = self.idml_package.read(tags_path)
-            if isinstance(tags_content, bytes):
-                tags_content = tags_content.decode('utf-8')
             
-            tags_root = ET.fromstring(tags_content)
+            tags_root = ET.fromstring(tags_content, _XML_PARSER)
             
             # Estrai definizioni tag
             xml_tags = {}
-            for elem in tags_root.iter():
-                elem_tag = self._remove_namespace(elem.tag)
-                
-                if elem_tag == 'XMLTag':
-                    tag_self = elem.get('Self', '')
-                    tag_name = elem.get('Name', '')
-                    xml_tags[tag_self] = {
-                        'name': tag_name,
-                        'color': elem.get('TagColor', ''),
-                        'properties': dict(elem.attrib)
-                    }
+            for elem in tags_root.iter(_XML_TAG_MATCH):
+                tag_self = elem.get('Self', '')
+                tag_name = elem.get('Name', '')
+                xml_tags[tag_self] = {
+                    'name': tag_name,
+                    'color': elem.get('TagColor', ''),
+                    'properties': dict(elem.attrib)
+                }
             
             # Aggiungi info tag alla struttura
             for elem_id, elem_info in self.xml_structure.items():
@@ -607,13 +1053,11 @@ class IDMLProcessor:
         # 1. Analizza Styles.xml per gli stili definiti
         try:
             styles_content = self.idml_package.read('Resources/Styles.xml')
-            if isinstance(styles_content, bytes):
-                styles_content = styles_content.decode('utf-8')
             
-            styles_root = ET.fromstring(styles_content)
+            styles_root = ET.fromstring(styles_content, _XML_PARSER)
             
             # Estrai ParagraphStyles
-            for elem in styles_root.iter():
+            for elem in styles_root.iter(*_STYLE_MATCHES):
                 elem_tag = self._remove_namespace(elem.tag)
                 
                 if elem_tag == 'ParagraphStyle':
@@ -665,18 +1109,30 @@ class IDMLProcessor:
         
         # 2. Analizza l'uso degli stili nelle stories
         override_count = 0
+        paragraph_styles = style_analysis['paragraph_styles']
+        character_styles = style_analysis['character_styles']
+        
+        # Conteggi stili usati e stili ancora inutilizzati aggiornati durante la scansione
+        used_para_styles = 0
+        used_char_styles = 0
+        unused_para_styles = dict.fromkeys(paragraph_styles)
+        unused_char_styles = dict.fromkeys(character_styles)
         
         for story_path, story_data in self.stories_data.items():
             story_root = story_data['root']
             
-            for elem in story_root.iter():
+            for elem in story_root.iter(*_STYLE_RANGE_MATCHES):
                 elem_tag = self._remove_namespace(elem.tag)
                 
                 # Conta uso ParagraphStyle
                 if elem_tag == 'ParagraphStyleRange':
                     applied_style = elem.get('AppliedParagraphStyle', '')
-                    if applied_style in style_analysis['paragraph_styles']:
-                        style_analysis['paragraph_styles'][applied_style]['usage_count'] += 1
+                    style_info = paragraph_styles.get(applied_style)
+                    if style_info is not None:
+                        if style_info['usage_count'] == 0:
+                            used_para_styles += 1
+                            del unused_para_styles[applied_style]
+                        style_info['usage_count'] += 1
                     
                     # Rileva override locali
                     local_overrides = self._detect_style_overrides(elem, 'paragraph')
@@ -687,8 +1143,12 @@ class IDMLProcessor:
                 # Conta uso CharacterStyle
                 elif elem_tag == 'CharacterStyleRange':
                     applied_style = elem.get('AppliedCharacterStyle', '')
-                    if applied_style in style_analysis['character_styles']:
-                        style_analysis['character_styles'][applied_style]['usage_count'] += 1
+                    style_info = character_styles.get(applied_style)
+                    if style_info is not None:
+                        if style_info['usage_count'] == 0:
+                            used_char_styles += 1
+                            del unused_char_styles[applied_style]
+                        style_info['usage_count'] += 1
                     
                     # Rileva override locali
                     local_overrides = self._detect_style_overrides(elem, 'character')
@@ -699,13 +1159,13 @@ class IDMLProcessor:
         # 3. Genera warnings per potenziali problemi
         # Stili non utilizzati
         unused_styles = []
-        for style_id, info in style_analysis['paragraph_styles'].items():
-            if info['usage_count'] == 0 and not style_id.endswith('/NormalParagraphStyle'):
-                unused_styles.append(f"Paragraph: {info['name']}")
+        for style_id in unused_para_styles:
+            if not style_id.endswith(_NORMAL_PARAGRAPH_STYLE_SUFFIX):
+                unused_styles.append(f"Paragraph: {paragraph_styles[style_id]['name']}")
         
-        for style_id, info in style_analysis['character_styles'].items():
-            if info['usage_count'] == 0 and not style_id.endswith('/NormalCharacterStyle'):
-                unused_styles.append(f"Character: {info['name']}")
+        for style_id in unused_char_styles:
+            if not style_id.endswith(_NORMAL_CHARACTER_STYLE_SUFFIX):
+                unused_styles.append(f"Character: {character_styles[style_id]['name']}")
         
         if unused_styles:
             style_analysis['warnings'].append(
@@ -723,20 +1183,22 @@ class IDMLProcessor:
             )
         
         # 4. Genera report
-        total_para_styles = len(style_analysis['paragraph_styles'])
-        total_char_styles = len(style_analysis['character_styles'])
-        used_para_styles = sum(1 for s in style_analysis['paragraph_styles'].values() if s['usage_count'] > 0)
-        used_char_styles = sum(1 for s in style_analysis['character_styles'].values() if s['usage_count'] > 0)
+        total_para_styles = len(paragraph_styles)
+        total_char_styles = len(character_styles)
         
-        print(f"\n📊 Analisi Consistenza Stili:")
-        print(f"   Stili Paragrafo: {used_para_styles}/{total_para_styles} utilizzati")
-        print(f"   Stili Carattere: {used_char_styles}/{total_char_styles} utilizzati")
-        print(f"   Override locali: {override_count}")
+        buf = io.StringIO()
+        w = buf.write
+        w(f"\n📊 Analisi Consistenza Stili:\n")
+        w(f"   Stili Paragrafo: {used_para_styles}/{total_para_styles} utilizzati\n")
+        w(f"   Stili Carattere: {used_char_styles}/{total_char_styles} utilizzati\n")
+        w(f"   Override locali: {override_count}\n")
         
         if style_analysis['warnings']:
-            print("   ⚠️  Avvisi:")
+            w("   ⚠️  Avvisi:\n")
             for warning in style_analysis['warnings']:
-                print(f"      {warning}")
+                w(f"      {warning}\n")
+        
+        sys.stdout.write(buf.getvalue())
         
         return style_analysis
     
@@ -763,24 +1225,14 @@ class IDMLProcessor:
         """Rileva override locali rispetto allo stile applicato."""
         overrides = []
         
-        # Attributi che se presenti indicano override locale
-        override_indicators = {
-            'paragraph': ['PointSize', 'Leading', 'Justification', 'LeftIndent', 'RightIndent'],
-            'character': ['FontStyle', 'PointSize', 'FillColor', 'BaselineShift', 'Tracking']
-        }
-        
-        indicators = override_indicators.get(style_type, [])
-        
-        found_overrides = []
-        for attr in indicators:
-            if attr in elem.attrib:
-                found_overrides.append(attr)
+        indicators = _OVERRIDE_INDICATORS.get(style_type, frozenset())
+        found_overrides = indicators.intersection(elem.attrib)
         
         if found_overrides:
             overrides.append({
                 'element': elem.tag,
                 'type': style_type,
-                'overridden_properties': found_overrides,
+                'overridden_properties': sorted(found_overrides),
                 'location': elem.get('Self', 'unknown')
             })
         
@@ -804,26 +1256,30 @@ class IDMLProcessor:
             'override_changes': []
         }
         
+        discrepancies = validation['discrepancies']
+        style_changes = validation['style_changes']
+        
         # Confronta conteggi stili
         for style_type in ['paragraph_styles', 'character_styles']:
             original_styles = original_analysis.get(style_type, {})
             translated_styles = translated_analysis.get(style_type, {})
             
             for style_id, orig_info in original_styles.items():
-                if style_id not in translated_styles:
-                    validation['discrepancies'].append(
+                trans_info = translated_styles.get(style_id, _MISSING)
+                if trans_info is _MISSING:
+                    discrepancies.append(
                         f"Stile mancante dopo traduzione: {orig_info['name']} ({style_type})"
                     )
                     validation['is_valid'] = False
-                else:
-                    trans_info = translated_styles[style_id]
-                    # Confronta usage count (potrebbe variare leggermente)
-                    if abs(orig_info['usage_count'] - trans_info['usage_count']) > 5:
-                        validation['style_changes'].append({
-                            'style': orig_info['name'],
-                            'original_count': orig_info['usage_count'],
-                            'translated_count': trans_info['usage_count']
-                        })
+                    continue
+                
+                # Confronta usage count (potrebbe variare leggermente)
+                if abs(orig_info['usage_count'] - trans_info['usage_count']) > 5:
+                    style_changes.append({
+                        'style': orig_info['name'],
+                        'original_count': orig_info['usage_count'],
+                        'translated_count': trans_info['usage_count']
+                    })
         
         # Confronta override
         orig_overrides = len(original_analysis.get('style_overrides', []))
@@ -849,7 +1305,7 @@ class IDMLProcessor:
             'is_valid': True,
             'errors': [],
             'warnings': [],
-            'tag_counts': {},
+            'tag_counts': Counter(),
             'broken_tags': [],
             'recommendations': []
         }
@@ -857,100 +1313,16 @@ class IDMLProcessor:
         if not self.idml_package:
             return validation_result
         
-        # Tag IDML critici da validare
-        critical_tags = {
-            'Br': 'Line breaks',
-            'Tab': 'Tab characters', 
-            'Content': 'Text content',
-            'CharacterStyleRange': 'Character formatting',
-            'ParagraphStyleRange': 'Paragraph formatting',
-            'TextFrame': 'Text containers',
-            'Rectangle': 'Graphic containers',
-            'Image': 'Images',
-            'Link': 'Resource links'
-        }
-        
-        # Pattern per identificare tag malformati
-        malformed_patterns = [
-            r'<(?![/\w])',  # Tag che non iniziano con lettera o /
-            r'<[^>]*[<>][^>]*>',  # Tag con < o > interni
-            r'<\s+\w+',  # Tag con spazi iniziali
-            r'<\w+[^>]*\s+>$',  # Tag con spazi finali prima della chiusura
-            r'<\w+.*?(?<!/)>\s*$',  # Tag non auto-chiusi senza contenuto
-        ]
-        
-        # Valida ogni story
+        # Valida ogni story dall'albero in memoria, serializzandola una alla volta
         for story_path, story_data in self.stories_data.items():
-            try:
-                # Controlla la struttura XML della story
-                story_xml = ET.tostring(story_data['root'], encoding='unicode')
-                
-                # Conta tag utilizzati
-                for tag_name in critical_tags.keys():
-                    tag_count = story_xml.count(f'<{tag_name}')
-                    if tag_name not in validation_result['tag_counts']:
-                        validation_result['tag_counts'][tag_name] = 0
-                    validation_result['tag_counts'][tag_name] += tag_count
-                
-                # Rileva tag malformati
-                for pattern in malformed_patterns:
-                    matches = re.findall(pattern, story_xml, re.MULTILINE)
-                    if matches:
-                        validation_result['broken_tags'].extend([
-                            {
-                                'story': story_path,
-                                'pattern': pattern,
-                                'matches': matches[:5],  # Primi 5 per non sovraccaricare
-                                'description': f'Tag malformati trovati in {story_path}'
-                            }
-                        ])
-                
-                # Verifica bilancio tag apertura/chiusura per tag critici
-                for tag_name in critical_tags.keys():
-                    opening_tags = len(re.findall(f'<{tag_name}[^>]*(?<!/)>', story_xml))
-                    closing_tags = len(re.findall(f'</{tag_name}>', story_xml))
-                    self_closing = len(re.findall(f'<{tag_name}[^>]*/>', story_xml))
-                    
-                    # I tag auto-chiusi sono bilanciati per definizione
-                    expected_closing = opening_tags - self_closing
-                    
-                    if expected_closing != closing_tags and expected_closing > 0:
-                        validation_result['errors'].append(
-                            f"Tag sbilanciati in {story_path}: {tag_name} "
-                            f"aperti={opening_tags}, chiusi={closing_tags}, auto-chiusi={self_closing}"
-                        )
-                        validation_result['is_valid'] = False
-                
-                # Verifica attributi critici
-                critical_attributes = [
-                    'Self', 'AppliedParagraphStyle', 'AppliedCharacterStyle',
-                    'AppliedLanguage', 'ItemTransform', 'ParentStory'
-                ]
-                
-                for elem in story_data['root'].iter():
-                    elem_tag = self._remove_namespace(elem.tag)
-                    
-                    # Verifica attributi Self per unicità
-                    if 'Self' in elem.attrib:
-                        self_value = elem.get('Self')
-                        if not self_value or len(self_value) < 3:
-                            validation_result['warnings'].append(
-                                f"Attributo Self vuoto o troppo corto in {story_path}: {elem_tag}"
-                            )
-                    
-                    # Verifica attributi stile
-                    if elem_tag in ['CharacterStyleRange', 'ParagraphStyleRange']:
-                        style_attr = 'AppliedCharacterStyle' if elem_tag == 'CharacterStyleRange' else 'AppliedParagraphStyle'
-                        if style_attr not in elem.attrib:
-                            validation_result['warnings'].append(
-                                f"Attributo stile mancante in {story_path}: {elem_tag} senza {style_attr}"
-                            )
-            
-            except ET.ParseError as e:
-                validation_result['errors'].append(f"Errore parsing XML in {story_path}: {e}")
+            story_xml = ET.tostring(story_data['root'], encoding='unicode')
+            story_result = _validate_story(story_path, story_xml, story_data['root'])
+            validation_result['tag_counts'].update(story_result['tag_counts'])
+            validation_result['broken_tags'].extend(story_result['broken_tags'])
+            validation_result['errors'].extend(story_result['errors'])
+            validation_result['warnings'].extend(story_result['warnings'])
+            if not story_result['is_valid']:
                 validation_result['is_valid'] = False
-            except Exception as e:
-                validation_result['warnings'].append(f"Errore validazione {story_path}: {e}")
         
         # Validazione specifica per elementi critici
         content_elements = validation_result['tag_counts'].get('Content', 0)
@@ -988,29 +1360,33 @@ class IDMLProcessor:
             )
         
         # Report finale
-        print(f"\n🔍 Validazione Integrità XML:")
-        print(f"   Tag validati: {len(critical_tags)}")
-        print(f"   Errori critici: {len(validation_result['errors'])}")
-        print(f"   Avvisi: {len(validation_result['warnings'])}")
+        buf = io.StringIO()
+        w = buf.write
+        w(f"\n🔍 Validazione Integrità XML:\n")
+        w(f"   Tag validati: {len(_CRITICAL_TAGS)}\n")
+        w(f"   Errori critici: {len(validation_result['errors'])}\n")
+        w(f"   Avvisi: {len(validation_result['warnings'])}\n")
         
         if validation_result['errors']:
-            print("   ❌ Errori critici:")
+            w("   ❌ Errori critici:\n")
             for error in validation_result['errors'][:5]:  # Primi 5
-                print(f"      {error}")
+                w(f"      {error}\n")
         
         if validation_result['warnings'] and len(validation_result['warnings']) <= 5:
-            print("   ⚠️  Avvisi:")
+            w("   ⚠️  Avvisi:\n")
             for warning in validation_result['warnings']:
-                print(f"      {warning}")
+                w(f"      {warning}\n")
         elif validation_result['warnings']:
-            print(f"   ⚠️  {len(validation_result['warnings'])} avvisi (primi 3):")
+            w(f"   ⚠️  {len(validation_result['warnings'])} avvisi (primi 3):\n")
             for warning in validation_result['warnings'][:3]:
-                print(f"      {warning}")
+                w(f"      {warning}\n")
         
         if validation_result['recommendations']:
-            print("   📌 Raccomandazioni:")
+            w("   📌 Raccomandazioni:\n")
             for rec in validation_result['recommendations']:
-                print(f"      {rec}")
+                w(f"      {rec}\n")
+        
+        sys.stdout.write(buf.getvalue())
         
         return validation_result
     
@@ -1040,18 +1416,10 @@ class IDMLProcessor:
             'estimated_time': '30-60 min'
         }
         
-        # Import datetime per timestamp
-        from datetime import datetime
-        checklist['generated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        checklist['generated_at'] = datetime.now().isoformat(sep=' ', timespec='seconds')
         
         # 1. CONTROLLI CRITICI (devono essere fatti)
-        checklist['critical_checks'] = [
-            "Aprire il file IDML tradotto in InDesign per verificare che si apra senza errori",
-            "Controllare che tutto il testo sia visibile e non ci siano overflow (testo che fuoriesce dai frame)",
-            "Verificare che la formattazione (grassetto, corsivo, colori) sia preservata",
-            "Controllare l'allineamento del testo e la spaziatura tra paragrafi",
-            "Verificare che i numeri di pagina (se presenti) siano corretti"
-        ]
+        checklist['critical_checks'] = list(_CRITICAL_CHECKS_BASE)
         
         # Aggiungi controlli specifici per font
         if font_validation.get('requires_special_fonts'):
@@ -1067,13 +1435,7 @@ class IDMLProcessor:
             )
         
         # 2. CONTROLLI RACCOMANDATI
-        checklist['recommended_checks'] = [
-            "Controllare che le immagini e i grafici siano ancora collegati correttamente",
-            "Verificare che i link ipertestuali (se presenti) funzionino ancora",
-            "Controllare la consistenza degli stili in tutto il documento",
-            "Verificare che i margini e le spaziature siano appropriate per la lingua di destinazione",
-            "Controllare che non ci siano caratteri orfani o vedove in posizioni critiche"
-        ]
+        checklist['recommended_checks'] = list(_RECOMMENDED_CHECKS_BASE)
         
         # Aggiungi controlli per grafiche con testo
         if linked_graphics.get('potential_text_graphics'):
@@ -1083,59 +1445,11 @@ class IDMLProcessor:
             ])
         
         # 3. CONTROLLI OPZIONALI
-        checklist['optional_checks'] = [
-            "Ottimizzare la disposizione del testo per una migliore leggibilità nella lingua di destinazione",
-            "Considerare modifiche culturali nella presentazione (colori, simboli, layout)",
-            "Verificare che le abbreviazioni e i formati numerici siano appropriati per la regione",
-            "Controllare la coerenza terminologica in tutto il documento"
-        ]
+        checklist['optional_checks'] = list(_OPTIONAL_CHECKS_BASE)
         
         # 4. NOTE SPECIFICHE PER LINGUA
-        language_notes = {
-            'de': [
-                "Il tedesco tende ad espandersi del 20-30% - verificare overflow",
-                "Controllare la composizione delle parole composte lunghe",
-                "Verificare l'uso corretto delle maiuscole per i sostantivi"
-            ],
-            'fr': [
-                "Il francese tende ad espandersi del 15-20% - verificare overflow", 
-                "Controllare gli spazi prima dei due punti e punti interrogativi",
-                "Verificare l'uso corretto degli accenti"
-            ],
-            'es': [
-                "Lo spagnolo tende ad espandersi del 15-25% - verificare overflow",
-                "Controllare l'uso dei segni di interrogazione e esclamazione invertiti",
-                "Verificare la concordanza di genere negli aggettivi"
-            ],
-            'it': [
-                "L'italiano ha espansione moderata del 10-15%",
-                "Controllare l'uso corretto degli apostrofi",
-                "Verificare gli accenti sulle parole tronche"
-            ],
-            'zh': [
-                "Verificare che tutti i caratteri cinesi siano visualizzati correttamente",
-                "Controllare la direzione del testo e l'allineamento",
-                "Verificare che non ci siano caratteri mancanti (□)"
-            ],
-            'ja': [
-                "Verificare mixing di hiragana, katakana e kanji",
-                "Controllare la direzione del testo (orizzontale vs verticale)",
-                "Verificare la punteggiatura giapponese"
-            ],
-            'ar': [
-                "CRITICO: Verificare la direzione RTL (destra-sinistra)",
-                "Controllare che la forma delle lettere arabe sia corretta nel contesto",
-                "Verificare l'allineamento del testo RTL"
-            ],
-            'he': [
-                "CRITICO: Verificare la direzione RTL (destra-sinistra)",
-                "Controllare la punteggiatura ebraica",
-                "Verificare l'allineamento del testo RTL"
-            ]
-        }
-        
-        if target_language in language_notes:
-            checklist['language_specific_notes'] = language_notes[target_language]
+        if target_language in _LANGUAGE_NOTES:
+            checklist['language_specific_notes'] = list(_LANGUAGE_NOTES[target_language])
         
         # 5. STIMA TEMPO
         base_time = 30
@@ -1159,30 +1473,33 @@ class IDMLProcessor:
     
     def print_dtp_checklist(self, checklist: Dict[str, Any]) -> None:
         """Stampa la checklist DTP in formato leggibile."""
-        print(f"\n📋 CHECKLIST DESKTOP PUBLISHING")
-        print(f"   Lingua: {checklist['target_language']}")
-        print(f"   Tempo stimato: {checklist['estimated_time']}")
-        print(f"   Generata: {checklist['generated_at']}")
-        
-        print(f"\n🔴 CONTROLLI CRITICI ({len(checklist['critical_checks'])} elementi):")
+        buf = io.StringIO()
+        w = buf.write
+        w(f"\n📋 CHECKLIST DESKTOP PUBLISHING\n")
+        w(f"   Lingua: {checklist['target_language']}\n")
+        w(f"   Tempo stimato: {checklist['estimated_time']}\n")
+        w(f"   Generata: {checklist['generated_at']}\n")
+        
+        w(f"\n🔴 CONTROLLI CRITICI ({len(checklist['critical_checks'])} elementi):\n")
         for i, check in enumerate(checklist['critical_checks'], 1):
-            print(f"   {i}. {check}")
+            w(f"   {i}. {check}\n")
         
-        print(f"\n🟡 CONTROLLI RACCOMANDATI ({len(checklist['recommended_checks'])} elementi):")
+        w(f"\n🟡 CONTROLLI RACCOMANDATI ({len(checklist['recommended_checks'])} elementi):\n")
         for i, check in enumerate(checklist['recommended_checks'], 1):
-            print(f"   {i}. {check}")
+            w(f"   {i}. {check}\n")
         
         if checklist['language_specific_notes']:
-            print(f"\n🌐 NOTE SPECIFICHE PER {checklist['target_language'].upper()}:")
+            w(f"\n🌐 NOTE SPECIFICHE PER {checklist['target_language'].upper()}:\n")
             for note in checklist['language_specific_notes']:
-                print(f"   • {note}")
+                w(f"   • {note}\n")
         
         if checklist['optional_checks']:
-            print(f"\n🟢 CONTROLLI OPZIONALI ({len(checklist['optional_checks'])} elementi):")
+            w(f"\n🟢 CONTROLLI OPZIONALI ({len(checklist['optional_checks'])} elementi):\n")
             for i, check in enumerate(checklist['optional_checks'], 1):
-                print(f"   {i}. {check}")
+                w(f"   {i}. {check}\n")
         
-        print(f"\n💡 Questa checklist può essere salvata e utilizzata come riferimento durante la revisione DTP.")
+        w(f"\n💡 Questa checklist può essere salvata e utilizzata come riferimento durante la revisione DTP.\n")
+        sys.stdout.write(buf.getvalue())
     
     def extract_master_pages_content(self) -> Dict[str, Any]:
         """
@@ -1197,88 +1514,79 @@ class IDMLProcessor:
         master_content = {}
         
         # Trova file master pages
-        master_files = []
-        for file_info in self.idml_package.infolist():
-            if 'MasterSpreads' in file_info.filename and file_info.filename.endswith('.xml'):
-                master_files.append(file_info.filename)
+        master_files = self.get_xml_files('MasterSpreads')
         
         print(f"🔍 Trovate {len(master_files)} master pages")
         
+        # NUOVO APPROCCIO: Trova TextFrame con ParentStory e cerca nelle stories corrispondenti.
+        # Le master vengono lette in sequenza (ZipFile non è thread-safe) e i loro
+        # TextFrame raccolti in parallelo: il parsing lxml rilascia il GIL
+        master_contents = []
         for master_file in master_files:
             try:
-                # Leggi contenuto master page
-                content = self.idml_package.read(master_file)
-                if isinstance(content, bytes):
-                    content = content.decode('utf-8')
-                
-                # Parse XML
-                master_root = ET.fromstring(content)
-                
+                master_contents.append(self._read(master_file))
+            except Exception as e:
+                print(f"Warning: Errore parsing master page {master_file}: {e}")
+                master_contents.append(None)
+        
+        workers = min(_MAX_PARSE_WORKERS, len(master_files))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                frame_references = list(executor.map(
+                    self._collect_master_frame_references, master_files, master_contents
+                ))
+        else:
+            frame_references = list(map(
+                self._collect_master_frame_references, master_files, master_contents
+            ))
+        
+        # Le stories sono alberi condivisi: il resto dell'estrazione resta sequenziale
+        for master_file, text_frame_references in zip(master_files, frame_references):
+            if text_frame_references is None:
+                continue
+            
+            try:
                 # Estrai testi traducibili dalle master pages
                 texts = []
                 page_number_elements = []
-                text_frame_references = []
-                
-                # NUOVO APPROCCIO: Trova TextFrame con ParentStory e cerca nelle stories corrispondenti
-                for element in master_root.iter():
-                    element_tag = self._remove_namespace(element.tag)
-                    
-                    # Cerca TextFrame che riferiscono a stories
-                    if element_tag == 'TextFrame':
-                        parent_story = element.get('ParentStory')
-                        if parent_story and parent_story != 'n':
-                            story_file = f"Stories/Story_{parent_story}.xml"
-                            text_frame_references.append({
-                                'frame_id': element.get('Self', 'unknown'),
-                                'story_file': story_file,
-                                'master_file': master_file
-                            })
                 
                 # Estrai contenuto dalle stories riferite dai text frame
                 for frame_ref in text_frame_references:
                     story_file = frame_ref['story_file'] 
                     try:
-                        # Leggi la story referenziata
-                        story_content = self.idml_package.read(story_file)
-                        if isinstance(story_content, bytes):
-                            story_content = story_content.decode('utf-8')
-                        
-                        story_root = ET.fromstring(story_content)
+                        # Story referenziata: stesso albero usato per il salvataggio
+                        story_root = self._get_story_root(story_file)
                         
                         # Cerca Content elements nella story
-                        for story_element in story_root.iter():
-                            story_tag = self._remove_namespace(story_element.tag)
-                            
-                            if story_tag == 'Content':
-                                if story_element.text and story_element.text.strip():
-                                    text_content = story_element.text.strip()
-                                    
-                                    # Identifica numeri di pagina dinamici
-                                    if self._is_dynamic_page_number(text_content):
-                                        page_number_elements.append({
-                                            'element': story_element,
-                                            'content': text_content,
-                                            'type': 'dynamic_page_number',
-                                            'frame_id': frame_ref['frame_id'],
-                                            'story_file': story_file
-                                        })
-                                    elif self._is_translatable_master_text(text_content):
-                                        texts.append({
-                                            'element': story_element,
-                                            'content': text_content,
-                                            'type': 'translatable_text',
-                                            'frame_id': frame_ref['frame_id'],
-                                            'story_file': story_file
-                                        })
-                    
+                        for story_element in story_root.iter(_CONTENT_MATCH):
+                            text_content = story_element.text
+                            if text_content and not text_content.isspace():
+                                text_content = text_content.strip()
+                                
+                                # Numeri di pagina dinamici o testo traducibile: header e
+                                # footer si ripetono, la decisione è in cache per testo
+                                text_type = _classify_master_text(text_content)
+                                if text_type is None:
+                                    continue
+                                
+                                text_info = {
+                                    'element': story_element,
+                                    'content': text_content,
+                                    'type': text_type,
+                                    'frame_id': frame_ref['frame_id'],
+                                    'story_file': story_file
+                                }
+                                if text_type == 'dynamic_page_number':
+                                    page_number_elements.append(text_info)
+                                else:
+                                    texts.append(text_info)
+                
                     except Exception as e:
                         print(f"Warning: Errore lettura story {story_file}: {e}")
                         continue
                 
                 if texts or page_number_elements:
                     master_content[master_file] = {
-                        'root': master_root,
-                        'original_content': content,
                         'translatable_texts': texts,
                         'page_number_elements': page_number_elements
                     }
@@ -1288,52 +1596,64 @@ class IDMLProcessor:
                 print(f"Warning: Errore parsing master page {master_file}: {e}")
                 continue
         
+        # Riusato da update_master_pages finché le stories non vengono modificate;
+        # i byte delle master spread, già elaborati, non servono più
+        self._master_content_cache = master_content
+        for master_file in master_files:
+            self._read_cache.pop(master_file, None)
         return master_content
     
-    def _is_dynamic_page_number(self, text: str) -> bool:
-        """Identifica marcatori di numerazione pagine dinamici"""
-        page_markers = [
-            '<#>',  # Numero pagina corrente
-            '<!#>',  # Numero pagina precedente  
-            '<$>',   # Numero pagina successiva
-            '<Auto Page Number>',
-            'CurrentPageNumber',
-            'NextPageNumber',
-            'PreviousPageNumber'
-        ]
+    def _collect_master_frame_references(self, master_file: str,
+                                         master_content: Optional[bytes]) -> Optional[List[Dict[str, str]]]:
+        """
+        Raccoglie i TextFrame di una master page che riferiscono a una story
         
-        # Controlla se contiene marker di pagina
-        for marker in page_markers:
-            if marker in text:
-                return True
+        Della master serve solo l'elenco dei TextFrame: parse in streaming dai byte,
+        liberando ogni frame (e i fratelli già visitati) dopo l'uso. Il filtro sul tag
+        avviene già in libxml2: un XPath sull'albero completo ha gli stessi tempi ma
+        richiede tutta la master in memoria. Non tocca stato condiviso, quindi può
+        girare in un thread pool.
         
-        # Controlla se è un numero isolato che potrebbe essere dinamico
-        if text.isdigit() and len(text) <= 3:
-            return True
-            
-        return False
+        Returns:
+            Lista di riferimenti frame -> story, None se la master non è leggibile
+        """
+        if master_content is None:
+            return None
+        
+        text_frame_references = []
+        try:
+            for _, element in ET.iterparse(
+                io.BytesIO(master_content), events=('end',), tag=_TEXTFRAME_MATCH, **_PARSER_OPTIONS
+            ):
+                # Cerca TextFrame che riferiscono a stories
+                parent_story = element.get('ParentStory')
+                story_file = None
+                if parent_story and parent_story != 'n':
+                    # None se la story è mancante o rinominata
+                    story_file = self._story_by_id.get(parent_story)
+                if story_file is not None:
+                    text_frame_references.append({
+                        'frame_id': element.get('Self', 'unknown'),
+                        'story_file': story_file,
+                        'master_file': master_file
+                    })
+                
+                _release_element(element)
+        except Exception as e:
+            print(f"Warning: Errore parsing master page {master_file}: {e}")
+            return None
+        
+        return text_frame_references
+    
+    def _is_dynamic_page_number(self, text: str) -> bool:
+        """Identifica marcatori di numerazione pagine dinamici"""
+        return _is_dynamic_page_number_text(text)
     
     def _is_translatable_master_text(self, text: str) -> bool:
         """Determina se il testo nella master page è traducibile"""
-        # Usa la stessa logica del text extractor ma più permissiva
-        if not text or len(text.strip()) < 2:
+        if not text:
             return False
-        
-        text_clean = text.strip()
-        
-        # Non tradurre marker tecnici
-        if self._is_dynamic_page_number(text_clean):
-            return False
-        
-        # Non tradurre solo punteggiatura
-        if re.match(r'^[^\w\s]+$', text_clean):
-            return False
-        
-        # Non tradurre identificatori puri (ma permetti parole)
-        if re.match(r'^[A-Z0-9_]{4,}$', text_clean) and not any(c.isalpha() for c in text_clean):
-            return False
-        
-        return True
+        return _classify_master_text(text.strip()) == 'translatable_text'
     
     def update_master_pages(self, master_translations: Dict[str, List[str]]) -> bool:
         """
@@ -1351,10 +1671,14 @@ class IDMLProcessor:
         updated_count = 0
         updated_stories = set()  # Track which stories we update to avoid duplicates
         
+        # Estrai una sola volta i contenuti per capire quali stories aggiornare
+        # (riusa l'ultima estrazione se le stories non sono cambiate nel frattempo)
+        master_content = self._master_content_cache
+        if master_content is None:
+            master_content = self.extract_master_pages_content()
+        
         for master_file, translations in master_translations.items():
             try:
-                # Prima, estrai i contenuti per capire quali stories aggiornare
-                master_content = self.extract_master_pages_content()
                 if master_file not in master_content:
                     continue
                 
@@ -1386,35 +1710,12 @@ class IDMLProcessor:
                         continue  # Evita aggiornamenti duplicati
                     
                     try:
-                        # Leggi story content
-                        story_content = self.idml_package.read(story_file)
-                        if isinstance(story_content, bytes):
-                            story_content = story_content.decode('utf-8')
-                        
-                        story_root = ET.fromstring(story_content)
-                        
-                        # Trova tutti gli elementi Content traducibili in questa story
-                        translatable_elements = []
-                        for element in story_root.iter():
-                            if self._remove_namespace(element.tag) == 'Content':
-                                if element.text and element.text.strip():
-                                    if self._is_translatable_master_text(element.text.strip()):
-                                        translatable_elements.append(element)
-                        
-                        # Applica traduzioni in ordine
-                        update_index = 0
+                        # Gli elementi estratti appartengono già all'albero in stories_data
                         for update in updates:
-                            if update_index < len(translatable_elements):
-                                translatable_elements[update_index].text = update['translation']
-                                update_index += 1
-                        
-                        # Salva la story aggiornata nella cache delle stories
-                        self.stories_data[story_file] = {
-                            'root': story_root,
-                            'original_content': story_content
-                        }
+                            update['element_ref']['element'].text = update['translation']
                         
                         updated_stories.add(story_file)
+                        self._modified_stories.add(story_file)
                         print(f"✅ Story {story_file} aggiornata per master page {master_file}")
                         
                     except Exception as e:
@@ -1427,8 +1728,59 @@ class IDMLProcessor:
                 print(f"❌ Errore aggiornamento master page {master_file}: {e}")
                 continue
         
+        # Le stories sono cambiate: l'estrazione in cache non è più valida
+        self._master_content_cache = None
         return updated_count > 0
     
+    def _get_story_root(self, story_file: str) -> ET.Element:
+        """
+        Restituisce la root della story già caricata in stories_data
+        
+        Se la story non è stata caricata (es. errore di parsing in load_idml) viene
+        letta ora e registrata, così le traduzioni delle master pages e quelle del
+        corpo lavorano sullo stesso albero.
+        """
+        story_data = self.stories_data.get(story_file)
+        if story_data is None:
+            story_data = self.stories_data[story_file] = {
+                'root': ET.fromstring(self._read(story_file), _XML_PARSER)
+            }
+        return story_data['root']
+    
+    def _iter_translatable_elements(self, story_name: str) -> Iterator[Tuple[ET.Element, str]]:
+        """
+        Produce gli elementi (Content, 'text'|'tail') traducibili di una story
+        
+        Usa la stessa logica di _find_text_elements in TextExtractor. Gli elementi
+        vengono prodotti durante la visita, così la sostituzione avviene nello stesso
+        passaggio; se la visita arriva in fondo l'indice viene memorizzato e
+        riusato dalle sostituzioni successive.
+        """
+        story_data = self.stories_data[story_name]
+        elements = story_data.get('translatable_elements')
+        if elements is not None:
+            yield from elements
+            return
+        
+        elements = []
+        # Stesso ordine dell'estrazione: i CharacterStyleRange in ordine di iter() e,
+        # per ciascuno, solo i Content figli diretti. Non è l'ordine di documento dei
+        # Content: se un range contiene una tabella o una nota seguita da altri
+        # Content, questi vengono prima di quelli dei range annidati
+        for csr_elem in _CSR_XPATH(story_data['root']):
+            for content_elem in csr_elem.iterchildren(_CONTENT_MATCH):
+                # Estrai il testo solo dai Content elements E applica lo stesso filtro
+                # di translatable_text (che scarta già testi vuoti o di soli spazi)
+                if self._text_extractor._is_translatable_text(content_elem.text):
+                    elements.append((content_elem, 'text'))
+                    yield elements[-1]
+                
+                # Content elements non dovrebbero avere tail text, ma controlliamo comunque
+                if self._text_extractor._is_translatable_text(content_elem.tail):
+                    elements.append((content_elem, 'tail'))
+                    yield elements[-1]
+        story_data['translatable_elements'] = elements
+    
     def get_text_content(self) -> Dict[str, List[str]]:
         """
         Estrae tutto il contenuto testuale dalle stories
@@ -1439,15 +1791,10 @@ class IDMLProcessor:
         text_content = {}
         
         for story_name, story_data in self.stories_data.items():
-            story_root = story_data['root']
-            texts = []
-            
-            # Cerca tutti gli elementi che contengono testo
-            for elem in story_root.iter():
-                if elem.text and elem.text.strip():
-                    texts.append(elem.text.strip())
-                if elem.tail and elem.tail.strip():
-                    texts.append(elem.tail.strip())
+            # Solo i nodi di testo con contenuto, selezionati da libxml2: la spaziatura
+            # di indentazione (la gran parte dei nodi) non arriva a Python. Il filtro
+            # resta per gli spazi Unicode (es. NBSP) che normalize-space() non toglie
+            texts = [text for text in map(str.strip, _TEXT_NODES_XPATH(story_data['root'])) if text]
             
             if texts:
                 text_content[story_name] = texts
@@ -1462,143 +1809,152 @@ class IDMLProcessor:
             translations: Dizionario story_name -> lista traduzioni per quella story
             target_language: Lingua di destinazione per aggiornare gli attributi
         """
-        # Importa TextExtractor per usare la stessa logica di filtraggio
-        from text_extractor import TextExtractor
-        
-        # Crea un extractor temporaneo per usare la logica di filtraggio
-        temp_extractor = TextExtractor()
-        
-        def remove_namespace(tag):
-            return tag.split('}')[-1] if '}' in tag else tag
-        
-        # Mappa codici lingua per IDML
-        language_map = {
-            'de': '$ID/German',
-            'en': '$ID/English', 
-            'es': '$ID/Spanish',
-            'fr': '$ID/French',
-            'it': '$ID/Italian'
-        }
+        # Le stories cambiano: l'estrazione delle master pages in cache non è più valida
+        self._master_content_cache = None
         
         for story_name, translated_texts in translations.items():
             if story_name not in self.stories_data:
                 continue
                 
-            story_root = self.stories_data[story_name]['root']
-            text_elements = []
-            
-            # PRESERVA TUTTI I PROCESSING INSTRUCTIONS (come <?ACE 18?>)
-            # Prima salva il contenuto XML originale per ripristino PI
-            original_xml_content = ET.tostring(story_root, encoding='unicode')
-            
-            # Cerca pattern di Processing Instructions nel testo XML
-            import re
-            pi_patterns = re.findall(r'<\?[^>]+\?>', original_xml_content)
-            
-            if pi_patterns:
-                print(f"   🔧 Trovati {len(pi_patterns)} Processing Instructions da preservare")
-            
-            # USA LA STESSA LOGICA IDENTICA di _find_text_elements in TextExtractor
-            # Cerca specificamente elementi Content dentro CharacterStyleRange
-            for element in story_root.iter():
-                element_tag = remove_namespace(element.tag)
-                
-                if element_tag == 'CharacterStyleRange':
-                    # AGGIORNA ATTRIBUTI LINGUA SE SPECIFICATO
-                    if target_language and target_language in language_map:
-                        element.set('AppliedLanguage', language_map[target_language])
-                    
-                    # Cerca elementi Content dentro questo CharacterStyleRange
-                    for content_elem in element:
-                        content_tag = remove_namespace(content_elem.tag)
-                        
-                        if content_tag == 'Content':
-                            # Estrai il testo solo dai Content elements E applica lo stesso filtro
-                            if content_elem.text and content_elem.text.strip():
-                                # IMPORTANTE: applica lo stesso filtro di translatable_text
-                                if temp_extractor._is_translatable_text(content_elem.text.strip()):
-                                    text_elements.append((content_elem, 'text'))
-                            
-                            # Content elements non dovrebbero avere tail text, ma controlliamo comunque
-                            if content_elem.tail and content_elem.tail.strip():
-                                if temp_extractor._is_translatable_text(content_elem.tail.strip()):
-                                    text_elements.append((content_elem, 'tail'))
-            
-            # Sostituisce i testi con le traduzioni
-            for i, (elem, attr_type) in enumerate(text_elements):
-                if i < len(translated_texts):
-                    if attr_type == 'text':
-                        elem.text = translated_texts[i]
-                    else:
-                        elem.tail = translated_texts[i]
-            
-            # RIPRISTINA I PROCESSING INSTRUCTIONS se sono stati persi
-            # Verifica se i PI sono ancora presenti nel contenuto finale
-            if pi_patterns:
-                final_xml_content = ET.tostring(story_root, encoding='unicode')
-                
-                # Conta PI presenti prima e dopo
-                final_pi_patterns = re.findall(r'<\?[^>]+\?>', final_xml_content)
-                
-                if len(final_pi_patterns) < len(pi_patterns):
-                    missing_count = len(pi_patterns) - len(final_pi_patterns)
-                    print(f"⚠️  {missing_count} Processing Instructions potrebbero essere stati persi durante la traduzione")
-                    
-                    # In caso di perdita, avvisa che potrebbe essere necessario controllare manualmente
-                    print("   💡 Suggerimento: verificare il documento in InDesign per eventuali problemi di formattazione")
+            story_data = self.stories_data[story_name]
+            story_root = story_data['root']
+            self._modified_stories.add(story_name)
+            
+            # I Processing Instructions (come <?ACE 18?>) sono nodi dell'albero lxml:
+            # le sostituzioni di .text/.tail non li toccano e il salvataggio li serializza
+            
+            # AGGIORNA ATTRIBUTI LINGUA SE SPECIFICATO. Visita separata da quella dei
+            # Content, che dopo la prima sostituzione usa l'indice in cache della story
+            if target_language and target_language in _LANGUAGE_MAP:
+                applied_language = _LANGUAGE_MAP[target_language]
+                for element in _CSR_XPATH(story_root):
+                    element.set('AppliedLanguage', applied_language)
+            
+            # Sostituisce i testi con le traduzioni mentre visita gli elementi Content
+            # dentro CharacterStyleRange; si ferma quando le traduzioni finiscono
+            text_elements = self._iter_translatable_elements(story_name)
+            for translated_text, (elem, attr_type) in zip(translated_texts, text_elements):
+                if attr_type == 'text':
+                    elem.text = translated_text
                 else:
-                    print(f"✅ Tutti i {len(pi_patterns)} Processing Instructions sono stati preservati")
+                    elem.tail = translated_text
     
-    def save_translated_idml(self, output_path: str) -> None:
+    def save_translated_idml(self, output_path: str, compression: int = zipfile.ZIP_DEFLATED,
+                             compresslevel: Optional[int] = _DEFAULT_COMPRESSLEVEL) -> None:
         """
         Salva il file IDML tradotto
         
+        Le entry non modificate mantengono la compressione originale; quella indicata
+        vale per le parti riscritte (le entry non compresse, come mimetype, restano tali).
+        
         Args:
             output_path: Path dove salvare il file tradotto
+            compression: Metodo zipfile per le parti riscritte (ZIP_DEFLATED o ZIP_STORED)
+            compresslevel: Livello di compressione (1 = più veloce, None = default zlib)
         """
         if not self.idml_package:
             raise RuntimeError("IDML non caricato. Chiamare load_idml() prima.")
         
-        import tempfile
-        import shutil
-        import zipfile
-        
         # Crea un file temporaneo per il nuovo IDML
         with tempfile.NamedTemporaryFile(delete=False, suffix='.idml') as temp_file:
             temp_path = temp_file.name
         
         try:
+            # Parti tradotte da riscrivere: path -> root
+            modified = self._modified_roots()
+            
             # Crea un nuovo file ZIP con il contenuto modificato
-            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as new_zip:
+            with zipfile.ZipFile(temp_path, 'w', compression, compresslevel=compresslevel) as new_zip:
                 # Copia tutti i file dal package originale
                 for file_info in self.idml_package.infolist():
-                    file_path = file_info.filename
+                    root = modified.get(file_info.filename)
                     
-                    # Se è una story che abbiamo modificato, usa il contenuto tradotto
-                    if file_path in self.stories_data:
-                        # Usa il serializer custom per preservare PI
-                        updated_xml = self._serialize_xml_with_pi(self.stories_data[file_path]['root'])
-                        new_zip.writestr(file_info, updated_xml)
-                    # Se è una master page che abbiamo modificato, usa il contenuto tradotto
-                    elif file_path in self.master_pages_data:
-                        # Usa il serializer custom per preservare PI
-                        updated_xml = self._serialize_xml_with_pi(self.master_pages_data[file_path]['root'])
-                        new_zip.writestr(file_info, updated_xml)
+                    # Story o master page tradotta: serializzata in streaming nella entry,
+                    # senza materializzare l'intero XML in memoria
+                    if root is not None:
+                        # Le entry compresse si aprono per nome, così ricevono metodo
+                        # e livello dell'archivio; quelle non compresse restano tali
+                        if file_info.compress_type == zipfile.ZIP_STORED:
+                            out_info = copy(file_info)
+                        else:
+                            out_info = file_info.filename
+                        with new_zip.open(out_info, 'w') as dst:
+                            self._write_xml_with_pi(root, dst)
                     else:
-                        # Copia il file originale
-                        original_content = self.idml_package.read(file_path)
-                        new_zip.writestr(file_info, original_content)
+                        # Copia il file originale in streaming, a blocchi, senza
+                        # materializzarlo in memoria. Si scrive su una copia del
+                        # ZipInfo: ZipFile.open('w') ne aggiorna offset e dimensioni,
+                        # che devono restare validi per il package sorgente
+                        with self.idml_package.open(file_info) as src, \
+                                new_zip.open(copy(file_info), 'w') as dst:
+                            shutil.copyfileobj(src, dst, _COPY_BUFFER_SIZE)
             
             # Sposta il file temporaneo alla destinazione finale
             shutil.move(temp_path, output_path)
             
         except Exception as e:
             # Cleanup in caso di errore
-            import os
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
             raise e
     
+    def _modified_roots(self) -> Dict[str, ET.Element]:
+        """
+        Restituisce le root di stories e master pages da riscrivere in salvataggio
+        
+        Delle stories solo quelle modificate: le altre vengono copiate dal package
+        originale senza riserializzarle. Se un path è sia story sia master page
+        vale la story.
+        
+        Returns:
+            Dizionario path nel package -> root XML
+        """
+        roots = {path: data['root'] for path, data in self.master_pages_data.items()}
+        roots.update(
+            (path, self.stories_data[path]['root'])
+            for path in self._modified_stories if path in self.stories_data
+        )
+        return roots
+    
+    def validate_saved_package(self, output_path: str) -> Dict[str, Any]:
+        """
+        Verifica i byte scritti da save_translated_idml senza ricaricare il documento
+        
+        Controlla che mimetype sia la prima entry non compressa e che le parti
+        riscritte (stories tradotte e master pages) siano integre (la lettura ne
+        verifica il CRC) e XML ben formato. Le altre entry sono copiate in streaming
+        dal package originale e non vengono rilette.
+        
+        Args:
+            output_path: Path del file IDML salvato
+        
+        Returns:
+            Dizionario con 'is_valid' ed eventuali 'errors'
+        """
+        result = {'is_valid': True, 'errors': []}
+        
+        try:
+            with zipfile.ZipFile(output_path) as package:
+                infos = package.infolist()
+                if (not infos or infos[0].filename != 'mimetype'
+                        or infos[0].compress_type != zipfile.ZIP_STORED):
+                    result['errors'].append("mimetype non è la prima entry non compressa del package")
+                
+                for path in self._modified_roots():
+                    try:
+                        ET.fromstring(package.read(path), _XML_PARSER)
+                    except KeyError:
+                        result['errors'].append(f"Entry mancante nel file salvato: {path}")
+                    except zipfile.BadZipFile as e:
+                        result['errors'].append(f"Entry corrotta nel file salvato ({path}): {e}")
+                    except ET.XMLSyntaxError as e:
+                        result['errors'].append(f"XML non valido nel file salvato ({path}): {e}")
+        except zipfile.BadZipFile as e:
+            result['errors'].append(f"Package salvato non leggibile: {e}")
+        
+        result['is_valid'] = not result['errors']
+        return result
+    
     def get_document_info(self) -> Dict[str, any]:
         """
         Ottiene informazioni generali sul documento IDML
@@ -1639,31 +1995,29 @@ class IDMLProcessor:
             return {}
         
         frame_info = {}
-        spread_files = []
         
         # Trova tutti i file spread
-        try:
-            for file_info in self.idml_package.infolist():
-                if file_info.filename.startswith('Spreads/') and file_info.filename.endswith('.xml'):
-                    spread_files.append(file_info.filename)
-        except Exception as e:
-            print(f"Errore lettura spreads: {e}")
-            return {}
+        spread_files = self.get_xml_files('Spreads')
         
-        # Analizza ogni spread
+        # Legge gli spread in sequenza (ZipFile non è thread-safe), poi li analizza in
+        # parallelo: il parsing lxml rilascia il GIL
+        spread_contents = []
         for spread_file in spread_files:
             try:
-                spread_content = self.idml_package.read(spread_file)
-                if isinstance(spread_content, bytes):
-                    spread_content = spread_content.decode('utf-8')
-                
-                spread_root = ET.fromstring(spread_content)
-                spread_frames = self._parse_spread_textframes(spread_root, spread_file)
-                frame_info.update(spread_frames)
-                
+                spread_contents.append(self._read(spread_file))
             except Exception as e:
-                print(f"Errore parsing spread {spread_file}: {e}")
-                continue
+                print(f"Errore lettura spread {spread_file}: {e}")
+                spread_contents.append(None)
+        
+        workers = min(_MAX_PARSE_WORKERS, len(spread_files))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._analyze_spread, spread_files, spread_contents))
+        else:
+            results = list(map(self._analyze_spread, spread_files, spread_contents))
+        
+        for spread_frames in results:
+            frame_info.update(spread_frames)
         
         return {
             'total_frames': len(frame_info),
@@ -1671,24 +2025,37 @@ class IDMLProcessor:
             'spread_files': spread_files
         }
     
-    def _parse_spread_textframes(self, spread_root: ET.Element, spread_file: str) -> Dict[str, Dict]:
-        """Parsa text frame in uno spread"""
-        
-        def remove_namespace(tag):
-            return tag.split('}')[-1] if '}' in tag else tag
+    def _analyze_spread(self, spread_file: str, spread_content: Optional[bytes]) -> Dict[str, Dict]:
+        """Analizza i text frame di uno spread già letto (eseguibile in un thread)"""
+        if spread_content is None:
+            return {}
+        try:
+            return self._parse_spread_textframes(spread_content, spread_file)
+        except Exception as e:
+            print(f"Errore parsing spread {spread_file}: {e}")
+            return {}
+    
+    def _parse_spread_textframes(self, spread_content: bytes, spread_file: str) -> Dict[str, Dict]:
+        """
+        Parsa text frame in uno spread in streaming
         
+        Ogni TextFrame viene elaborato alla chiusura del suo tag e poi rilasciato,
+        così in memoria resta al più un frame invece dell'intero spread.
+        """
         frames = {}
         
-        # Cerca tutti i TextFrame
-        for element in spread_root.iter():
-            if remove_namespace(element.tag) == 'TextFrame':
-                try:
-                    frame_data = self._extract_textframe_properties(element, spread_file)
-                    if frame_data:
-                        frames[frame_data['id']] = frame_data
-                except Exception as e:
-                    print(f"Errore parsing TextFrame: {e}")
-                    continue
+        for _, element in ET.iterparse(
+            io.BytesIO(spread_content), events=('end',), tag=_TEXTFRAME_MATCH, **_PARSER_OPTIONS
+        ):
+            try:
+                frame_data = self._extract_textframe_properties(element, spread_file)
+                if frame_data:
+                    frames[frame_data['id']] = frame_data
+            except Exception as e:
+                print(f"Errore parsing TextFrame: {e}")
+            
+            # Libera il frame elaborato e i fratelli precedenti già visitati
+            _release_element(element)
         
         return frames
     
@@ -1698,12 +2065,13 @@ class IDMLProcessor:
         # ID del frame
         frame_id = textframe_elem.get('Self', f"{spread_file}_{id(textframe_elem)}")
         
-        # Transform matrix per posizione e dimensioni  
-        transform = textframe_elem.get('ItemTransform', '1 0 0 1 0 0')
-        transform_values = [float(x) for x in transform.split()]
+        # Transform matrix per posizione e dimensioni. Le matrici sono quasi sempre
+        # diverse per ogni frame: parse diretto, senza passare dalla cache (che
+        # resta per gli inset, ripetuti su molti frame)
+        transform_parts = textframe_elem.get('ItemTransform', '1 0 0 1 0 0').split()
         
-        if len(transform_values) >= 6:
-            scale_x, skew_y, skew_x, scale_y, x, y = transform_values[:6]
+        if len(transform_parts) >= 6:
+            scale_x, skew_y, skew_x, scale_y, x, y = map(float, transform_parts[:6])
             width = abs(scale_x)
             height = abs(scale_y)
         else:
@@ -1716,7 +2084,7 @@ class IDMLProcessor:
         # Margini interni
         inset = textframe_elem.get('TextFramePreferenceInsetSpacing', '0 0 0 0')
         try:
-            inset_values = [float(v) for v in inset.split()]
+            inset_values = _parse_float_values(inset)
             if len(inset_values) == 4:
                 top, right, bottom, left = inset_values
             elif len(inset_values) == 1:
@@ -1730,26 +2098,38 @@ class IDMLProcessor:
         font_size = 12.0
         leading = 14.4
         
-        # Cerca attributi font nel frame
-        for attr, value in textframe_elem.attrib.items():
+        # Cerca attributi font nel frame (lookup diretto, senza scorrere tutti gli attributi)
+        attrib = textframe_elem.attrib
+        for attr in _FRAME_FONT_SIZE_ATTRS:
+            if attr in attrib:
+                try:
+                    font_size = float(attrib[attr])
+                except ValueError:
+                    continue
+        if 'Leading' in attrib:
             try:
-                if 'FontSize' in attr or 'PointSize' in attr:
-                    font_size = float(value)
-                elif 'Leading' in attr:
-                    leading = float(value)
-            except:
-                continue
+                leading = float(attrib['Leading'])
+            except ValueError:
+                pass
         
         if leading <= font_size:
             leading = font_size * 1.2
         
-        # Conta caratteri nel contenuto
+        # Conta caratteri nel contenuto. Negli spread quasi tutti i nodi di testo sono
+        # solo indentazione: se l'XPath non trova altro, conta solo la coda del frame
+        if _FRAME_HAS_TEXT_XPATH(textframe_elem):
+            elements = textframe_elem.iter()
+        else:
+            elements = (textframe_elem,)
+        
         char_count = 0
-        for elem in textframe_elem.iter():
-            if elem.text:
-                char_count += len(elem.text.strip())
-            if elem.tail:
-                char_count += len(elem.tail.strip())
+        for elem in elements:
+            text = elem.text
+            if text and not text.isspace():
+                char_count += len(text.strip())
+            tail = elem.tail
+            if tail and not tail.isspace():
+                char_count += len(tail.strip())
         
         # Calcola capacità stimata
         effective_width = width - left - right
@@ -1802,34 +2182,23 @@ class IDMLProcessor:
         
         # Trova e modifica gli spread
         try:
-            for file_info in self.idml_package.infolist():
-                if not (file_info.filename.startswith('Spreads/') and file_info.filename.endswith('.xml')):
-                    continue
-                
-                # Leggi contenuto spread
-                spread_content = self.idml_package.read(file_info.filename)
-                if isinstance(spread_content, bytes):
-                    spread_content = spread_content.decode('utf-8')
-                
-                spread_root = ET.fromstring(spread_content)
+            for spread_file in self.get_xml_files('Spreads'):
+                spread_root = self._get_spread_root(spread_file)
                 modified = False
                 
                 # Cerca e modifica TextFrame
-                for element in spread_root.iter():
-                    if self._remove_namespace(element.tag) == 'TextFrame':
-                        frame_id = element.get('Self')
-                        
-                        if frame_id in frame_modifications:
-                            changes = frame_modifications[frame_id]
-                            if self._apply_frame_modifications(element, changes):
-                                modified = True
-                                modifications_applied += 1
+                for element in spread_root.iter(_TEXTFRAME_MATCH):
+                    frame_id = element.get('Self')
+                    
+                    if frame_id in frame_modifications:
+                        changes = frame_modifications[frame_id]
+                        if self._apply_frame_modifications(element, changes):
+                            modified = True
+                            modifications_applied += 1
                 
-                # Salva spread modificato se necessario
+                # Lo spread modificato resta nella cache (richiederà un salvataggio completo)
                 if modified:
-                    modified_xml = ET.tostring(spread_root, encoding='unicode')
-                    # Sostituisci nel package (questo richiederà un salvataggio completo)
-                    print(f"✅ Modificati frame in {file_info.filename}")
+                    print(f"✅ Modificati frame in {spread_file}")
         
         except Exception as e:
             print(f"Errore modifica frame: {e}")
@@ -1866,8 +2235,10 @@ class IDMLProcessor:
             if 'inset_spacing' in changes:
                 new_insets = changes['inset_spacing']
                 if isinstance(new_insets, (list, tuple)) and len(new_insets) == 4:
-                    inset_str = ' '.join(str(x) for x in new_insets)
-                    textframe_elem.set('TextFramePreferenceInsetSpacing', inset_str)
+                    inset_str = ' '.join(map(str, new_insets))
+                    # Nessuna scrittura se il valore è già quello richiesto
+                    if textframe_elem.get('TextFramePreferenceInsetSpacing') != inset_str:
+                        textframe_elem.set('TextFramePreferenceInsetSpacing', inset_str)
                     applied = True
             
             # Modifica dimensioni frame
@@ -1878,13 +2249,16 @@ class IDMLProcessor:
                 
                 if len(transform_values) >= 6:
                     # Modifica width e height se specificati
+                    new_values = list(transform_values)
                     if 'width' in resize_data:
-                        transform_values[0] = resize_data['width']
+                        new_values[0] = resize_data['width']
                     if 'height' in resize_data:
-                        transform_values[3] = resize_data['height']
+                        new_values[3] = resize_data['height']
                     
-                    new_transform = ' '.join(str(x) for x in transform_values)
-                    textframe_elem.set('ItemTransform', new_transform)
+                    # Riformatta e riscrive la matrice solo se è cambiata: la stringa
+                    # originale resta intatta (es. "100" invece di "100.0")
+                    if new_values != transform_values:
+                        textframe_elem.set('ItemTransform', ' '.join(map(str, new_values)))
                     applied = True
         
         except Exception as e:
@@ -1893,33 +2267,35 @@ class IDMLProcessor:
         
         return applied
     
+    def _get_spread_root(self, spread_file: str) -> ET.Element:
+        """Restituisce la root parsata di uno spread, leggendola dal package una sola volta"""
+        spread_root = self.spread_cache.get(spread_file)
+        if spread_root is None:
+            spread_root = ET.fromstring(self._read(spread_file), _XML_PARSER)
+            self.spread_cache[spread_file] = spread_root
+            # Da qui in poi lo spread vive nell'albero: i byte non servono più
+            self._read_cache.pop(spread_file, None)
+        return spread_root
+    
     def _remove_namespace(self, tag: str) -> str:
-        """Rimuove namespace da tag XML"""
-        return tag.split('}')[-1] if '}' in tag else tag
+        """Rimuove namespace da tag XML (stringa vuota per commenti e PI)"""
+        return _strip_namespace(tag)
     
-    def _serialize_xml_with_pi(self, root: ET.Element) -> str:
+    def _write_xml_with_pi(self, root: ET.Element, output: BinaryIO) -> None:
         """
-        Serializza XML preservando i Processing Instructions in modo più robusto.
+        Scrive XML (in UTF-8) su un file binario preservando i Processing Instructions.
+        
+        lxml serializza PI, CDATA e commenti senza perdite e passa i byte al file
+        a blocchi, man mano che li produce: in caso di errore non esiste un
+        fallback equivalente, quindi si propaga l'eccezione invece di scrivere
+        XML alterato.
         """
         try:
-            # Usa il metodo standard di ElementTree
-            xml_str = ET.tostring(root, encoding='unicode', method='xml')
-            
-            # Se la serializzazione è riuscita, restituisci il risultato
-            return xml_str
-            
+            with ET.xmlfile(output, encoding='UTF-8') as xf:
+                xf.write(root)
         except Exception as e:
             print(f"⚠️  Errore nella serializzazione XML: {e}")
-            
-            # Fallback: prova con minidom se disponibile
-            try:
-                from xml.dom import minidom
-                rough_string = ET.tostring(root, encoding='unicode')
-                reparsed = minidom.parseString(rough_string)
-                return reparsed.toprettyxml(indent="", newl="")
-            except:
-                # Ultimo fallback: restituisci stringa grezza
-                return ET.tostring(root, encoding='unicode')
+            raise
     
     def generate_overflow_adjustments(self, overflow_predictions: List) -> Dict[str, Dict]:
         """
@@ -1940,33 +2316,28 @@ class IDMLProcessor:
             frame_id = prediction.frame_id
             overflow_amount = prediction.estimated_translated_length - prediction.available_space_chars
             
-            # Strategia 1: Riduzione font size (5-10%)
-            font_reduction = {
-                'font_size': 11.0,  # Da 12.0 default
-                'leading': 13.2,   # Proporzionale
-                'reason': f'Riduzione font per {overflow_amount} caratteri overflow'
-            }
-            
-            # Strategia 2: Riduzione margini interni
-            inset_reduction = {
-                'inset_spacing': [3.0, 3.0, 3.0, 3.0],  # Margini ridotti
-                'reason': f'Riduzione margini per overflow di {overflow_amount} caratteri'
-            }
-            
-            # Strategia 3: Resize frame (aumenta altezza)
-            height_increase = max(20.0, overflow_amount * 0.2)  # Stima aumento necessario
-            frame_resize = {
-                'resize': {'height': height_increase},
-                'reason': f'Aumento altezza di {height_increase}pt per overflow'
-            }
-            
-            # Scegli strategia in base al rischio
-            if prediction.overflow_risk < 1.2:
-                adjustments[frame_id] = inset_reduction
-            elif prediction.overflow_risk < 1.5:
-                adjustments[frame_id] = font_reduction
+            # Scegli strategia in base al rischio (si costruisce solo quella scelta)
+            risk = prediction.overflow_risk
+            if risk < 1.2:
+                # Strategia 2: Riduzione margini interni
+                adjustments[frame_id] = {
+                    'inset_spacing': list(_REDUCED_INSET_SPACING),
+                    'reason': f'Riduzione margini per overflow di {overflow_amount} caratteri'
+                }
+            elif risk < 1.5:
+                # Strategia 1: Riduzione font size (5-10%)
+                adjustments[frame_id] = {
+                    'font_size': _REDUCED_FONT_SIZE,
+                    'leading': _REDUCED_LEADING,
+                    'reason': f'Riduzione font per {overflow_amount} caratteri overflow'
+                }
             else:
-                adjustments[frame_id] = frame_resize
+                # Strategia 3: Resize frame (aumenta altezza)
+                height_increase = max(20.0, overflow_amount * 0.2)  # Stima aumento necessario
+                adjustments[frame_id] = {
+                    'resize': {'height': height_increase},
+                    'reason': f'Aumento altezza di {height_increase}pt per overflow'
+                }
         
         return adjustments
     
@@ -1976,6 +2347,18 @@ class IDMLProcessor:
             import shutil
             shutil.rmtree(self.temp_dir)
         
+        # Rilascia l'handle dello zip (tutte le letture passano da questo unico file)
+        if self.idml_package is not None:
+            self.idml_package.close()
+        
         self.idml_package = None
         self.stories_data = {}
-        self.master_pages_data = {}
\ No newline at end of file
+        self._modified_stories = set()
+        self._read_cache = {}
+        self.master_pages_data = {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
\ No newline at end of file
@@ -4,25 +4,18 @@ Translate IDML - Applicazione CLI per tradurre file InDesign IDML
 """
 
 import os
+import re
 import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-import asyncio
+from typing import Dict, List, Optional, Tuple
 import logging
 
 import click
 from dotenv import load_dotenv
 
-from idml_processor import IDMLProcessor
-from text_extractor import TextExtractor
-from translator import Translator
-from domain_translator import DomainAwareTranslator
-from document_analyzer import DocumentAnalyzer
-from context_detector import DocumentContextDetector
-from async_translator import AsyncTranslator
-from translation_memory import TranslationMemory
-from consistency_checker import ConsistencyChecker
-from enhanced_post_processor import EnhancedTranslationPostProcessor
+# I moduli di elaborazione (lxml, openai, aiohttp...) vengono importati nei comandi
+# che li usano: --help e i comandi informativi partono senza caricarli
 
 
 # Carica variabili d'ambiente
@@ -36,21 +29,50 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Parole chiave nel nome file per il rilevamento del dominio (una regex per dominio)
+_SAFETY_KEYWORDS = ('safeguard', 'safety', 'sicurezza', 'anticaduta', 'protezione')
+_CONSTRUCTION_KEYWORDS = ('skyfix', 'riwega', 'dach', 'roof', 'tetto', 'construction')
+_SAFETY_RE = re.compile('|'.join(map(re.escape, _SAFETY_KEYWORDS)))
+_CONSTRUCTION_RE = re.compile('|'.join(map(re.escape, _CONSTRUCTION_KEYWORDS)))
+
+# Espansione massima predefinita del testo tradotto (%) per lingua target
+_DEFAULT_EXPANSION = {'de': 30, 'en': 10, 'fr': 15, 'es': 5, 'pt': 10}
+_DEFAULT_EXPANSION_FALLBACK = 20
+
+
+@lru_cache(maxsize=256)
 def _detect_domain_from_filename(filename: str) -> str:
-    """Rileva automaticamente il dominio dal nome del file"""
+    """Rileva automaticamente il dominio dal nome del file (in cache: batch e più lingue)"""
     filename_lower = filename.lower()
     
-    safety_keywords = ['safeguard', 'safety', 'sicurezza', 'anticaduta', 'protezione']
-    construction_keywords = ['skyfix', 'riwega', 'dach', 'roof', 'tetto', 'construction']
-    
-    if any(keyword in filename_lower for keyword in safety_keywords):
+    if _SAFETY_RE.search(filename_lower):
         return 'safety'
-    elif any(keyword in filename_lower for keyword in construction_keywords):
+    elif _CONSTRUCTION_RE.search(filename_lower):
         return 'construction'
     
     return 'technical'  # Default
 
 
+def _collect_master_texts(master_content: Dict) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Raccoglie i testi traducibili delle master pages
+    
+    Returns:
+        Tupla (lista piatta dei testi, master file -> testi del file)
+    """
+    master_texts = []
+    master_file_mapping = {}
+    
+    for master_file, master_data in master_content.items():
+        translatable_texts = master_data.get('translatable_texts', [])
+        if translatable_texts:
+            master_file_texts = [text_info['content'] for text_info in translatable_texts]
+            master_texts.extend(master_file_texts)
+            master_file_mapping[master_file] = master_file_texts
+    
+    return master_texts, master_file_mapping
+
+
 @click.command()
 @click.argument('input_file', type=click.Path(exists=True, path_type=Path))
 @click.option('--output', '-o', type=click.Path(path_type=Path), 
@@ -86,6 +108,12 @@ def _detect_domain_from_filename(filename: str) -> str:
               help='Usa traduzione asincrona per performance migliori (default: attivo)')
 @click.option('--max-concurrent', type=int, default=5,
               help='Numero massimo di richieste API concorrenti (default: 5)')
+@click.option('--prompts-per-request', type=int, default=1,
+              help='Testi tradotti in una stessa richiesta API in modalità asincrona (default: 1)')
+@click.option('--max-rpm', type=int, default=None,
+              help='Limite di richieste API al minuto in modalità asincrona')
+@click.option('--max-tpm', type=int, default=None,
+              help='Limite di token API al minuto in modalità asincrona')
 @click.option('--post-process', is_flag=True, default=True,
               help='Applica correzioni automatiche post-traduzione (default: attivo)')
 @click.option('--prevent-overflow', is_flag=True, default=False,
@@ -101,7 +129,8 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
          context: Optional[str], auto_context: bool, context_template: Optional[str],
          preview: bool, estimate_cost: bool, verbose: bool,
          use_cache: bool, update_tm: bool, check_consistency: bool,
-         async_mode: bool, max_concurrent: int, post_process: bool,
+         async_mode: bool, max_concurrent: int, prompts_per_request: int,
+         max_rpm: Optional[int], max_tpm: Optional[int], post_process: bool,
          prevent_overflow: bool, max_expansion: Optional[int],
          compression_mode: str, overflow_report: bool):
     """
@@ -109,6 +138,18 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
     
     INPUT_FILE: Path al file IDML da tradurre
     """
+    import asyncio
+    
+    from idml_processor import IDMLProcessor
+    from text_extractor import TextExtractor
+    from translator import Translator
+    from domain_translator import DomainAwareTranslator
+    from document_analyzer import DocumentAnalyzer
+    from context_detector import DocumentContextDetector
+    from async_translator import AsyncTranslator
+    from translation_memory import TranslationMemory
+    from consistency_checker import ConsistencyChecker
+    from enhanced_post_processor import EnhancedTranslationPostProcessor
     
     # Validazione parametri
     if not input_file.suffix.lower() == '.idml':
@@ -127,16 +168,22 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
         output = input_file.with_stem(f"{input_file.stem}_{target_lang}")
     
     if verbose:
-        click.echo(f"📁 File input: {input_file}")
-        click.echo(f"📁 File output: {output}")
-        click.echo(f"🌍 Lingua target: {target_lang}")
+        # Blocchi di più righe: una sola scrittura (e un solo flush) su stdout
+        lines = [
+            f"📁 File input: {input_file}",
+            f"📁 File output: {output}",
+            f"🌍 Lingua target: {target_lang}",
+        ]
         if source_lang:
-            click.echo(f"🌍 Lingua source: {source_lang}")
-        click.echo(f"🤖 Modello: {model}")
-        click.echo(f"🎯 Dominio rilevato: {detected_domain}")
-        click.echo(f"⚡ Modalità: {'Asincrona' if async_mode else 'Sincrona'}")
-        click.echo(f"💾 Cache TM: {'Attiva' if use_cache else 'Disattiva'}")
-        click.echo()
+            lines.append(f"🌍 Lingua source: {source_lang}")
+        lines += [
+            f"🤖 Modello: {model}",
+            f"🎯 Dominio rilevato: {detected_domain}",
+            f"⚡ Modalità: {'Asincrona' if async_mode else 'Sincrona'}",
+            f"💾 Cache TM: {'Attiva' if use_cache else 'Disattiva'}",
+            "",
+        ]
+        click.echo("\n".join(lines))
     
     try:
         # 1. Carica e processa il file IDML
@@ -158,14 +205,6 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
                 click.echo("Traduzione annullata.")
                 sys.exit(1)
         
-        # 1c. Controllo grafiche collegate con possibile testo
-        linked_graphics_check = processor.check_linked_graphics_text()
-        if linked_graphics_check['potential_text_graphics'] and verbose:
-            click.echo("\n📌 Nota: alcune grafiche collegate potrebbero contenere testo da tradurre separatamente.")
-        
-        # 1d. Analisi consistenza stili (per validazione post-traduzione)
-        original_style_analysis = processor.analyze_style_consistency()
-        
         # 2. ANALISI PRELIMINARE DEL DOCUMENTO
         if verbose:
             click.echo("🔍 Analisi preliminare documento...")
@@ -192,11 +231,13 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
         # Statistiche
         stats = extractor.get_translation_stats(text_segments)
         
-        click.echo(f"📊 Statistiche:")
-        click.echo(f"   Segmenti di testo: {stats['total_segments']}")
-        click.echo(f"   Caratteri totali: {stats['total_characters']:,}")
-        click.echo(f"   Parole totali: {stats['total_words']:,}")
-        click.echo(f"   Stories coinvolte: {stats['stories_count']}")
+        click.echo("\n".join([
+            f"📊 Statistiche:",
+            f"   Segmenti di testo: {stats['total_segments']}",
+            f"   Caratteri totali: {stats['total_characters']:,}",
+            f"   Parole totali: {stats['total_words']:,}",
+            f"   Stories coinvolte: {stats['stories_count']}",
+        ]))
         
         # 4. Integrazione contesto da analisi
         document_context = doc_analysis['translation_context']
@@ -240,12 +281,13 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
         
         # Modalità preview
         if preview:
-            click.echo(f"\n📋 Anteprima testi da tradurre:")
+            lines = [f"\n📋 Anteprima testi da tradurre:"]
             for i, text in enumerate(texts_to_translate[:10], 1):  # Mostra primi 10
-                click.echo(f"   {i}. {text[:80]}{'...' if len(text) > 80 else ''}")
+                lines.append(f"   {i}. {text[:80]}{'...' if len(text) > 80 else ''}")
             
             if len(texts_to_translate) > 10:
-                click.echo(f"   ... e altri {len(texts_to_translate) - 10} testi")
+                lines.append(f"   ... e altri {len(texts_to_translate) - 10} testi")
+            click.echo("\n".join(lines))
             
             return
         
@@ -270,6 +312,23 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
                 if estimate_cost:
                     return
         
+        # 1c. Controllo grafiche collegate con possibile testo (serve alla checklist
+        # DTP finale: non calcolato per anteprima e stima costi)
+        linked_graphics_check = processor.check_linked_graphics_text()
+        if linked_graphics_check['potential_text_graphics'] and verbose:
+            click.echo("\n📌 Nota: alcune grafiche collegate potrebbero contenere testo da tradurre separatamente.")
+        
+        # 1d. Analisi consistenza stili del documento originale, solo se verrà
+        # confrontata con quella tradotta (prima di qualsiasi sostituzione)
+        if check_consistency:
+            original_style_analysis = processor.analyze_style_consistency()
+        
+        # Testi delle master pages: raccolti prima della traduzione così in modalità
+        # asincrona viaggiano nello stesso batch (e nella stessa sessione) del corpo
+        master_content = processor.extract_master_pages_content()
+        master_texts_to_translate, master_file_mapping = _collect_master_texts(master_content)
+        master_translations = None
+        
         # 4. Traduci
         if verbose:
             click.echo(f"\n🌍 Avvio traduzione in {target_lang}...")
@@ -279,31 +338,32 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
             if verbose:
                 click.echo("   Modalità asincrona attiva - traduzioni parallele")
                 
-            # Esegui traduzione asincrona
+            # Esegui traduzione asincrona: testi e master pages in un unico batch,
+            # statistiche lette dallo stesso translator
             async def async_translate():
                 async with AsyncTranslator(
-                    api_key, model, max_concurrent, use_cache
+                    api_key, model, max_concurrent, use_cache,
+                    prompts_per_request=prompts_per_request,
+                    max_rpm=max_rpm, max_tpm=max_tpm
                 ) as translator:
-                    return await translator.translate_texts_batch(
-                        texts_to_translate, target_lang, source_lang, 
+                    combined = await translator.translate_texts_batch(
+                        texts_to_translate + master_texts_to_translate, target_lang, source_lang, 
                         final_context, document_context
                     )
+                    return combined, translator.get_statistics()
                     
-            translated_texts = asyncio.run(async_translate())
+            combined_translations, async_stats = asyncio.run(async_translate())
             
-            # Ottieni statistiche
-            async def get_stats():
-                async with AsyncTranslator(
-                    api_key, model, max_concurrent, use_cache
-                ) as translator:
-                    return translator.get_statistics()
-                    
-            async_stats = asyncio.run(get_stats())
+            split_index = len(texts_to_translate)
+            translated_texts = combined_translations[:split_index]
+            master_translations = combined_translations[split_index:]
             
             if verbose and async_stats:
                 click.echo(f"\n📈 Statistiche traduzione:")
                 click.echo(f"   Cache hits: {async_stats['cache_hits']}")
                 click.echo(f"   API calls: {async_stats['api_calls']}")
+                if async_stats['group_fallbacks'] > 0:
+                    click.echo(f"   Gruppi ritradotti singolarmente: {async_stats['group_fallbacks']}")
                 click.echo(f"   Tempo totale: {async_stats['total_time']:.2f}s")
                 if async_stats['cache_hits'] > 0:
                     click.echo(f"   Cache hit rate: {async_stats['cache_hit_rate']:.1%}")
@@ -347,15 +407,18 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
         if verbose:
             click.echo(f"✅ Traduzione completata ({len(translated_texts)} testi)")
         
+        # Post-processor unico per corpo, overflow e master pages: le regole
+        # vengono costruite una sola volta
+        enhanced_processor = EnhancedTranslationPostProcessor() if post_process else None
+        
         # 5. Post-processing avanzato per correzioni automatiche
         if post_process:
             if verbose:
                 click.echo("🔧 Applicazione correzioni avanzate post-traduzione...")
                 
-            enhanced_processor = EnhancedTranslationPostProcessor()
-            original_translations = translated_texts.copy()
-            # Backup traduzioni originali per report
-            original_translations = translated_texts.copy()
+            # Traduzioni originali per il report: process_translations restituisce una
+            # nuova lista senza modificare quella ricevuta, basta il riferimento
+            original_translations = translated_texts
             
             translated_texts = enhanced_processor.process_translations(translated_texts, target_lang)
             
@@ -387,17 +450,12 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
                 click.echo("📏 Applicazione correzioni overflow prevention...")
             
             # Calcola lunghezze massime basate su espansione
-            expansion_factor = max_expansion if max_expansion else {
-                'de': 30, 'en': 10, 'fr': 15, 'es': 5, 'pt': 10
-            }.get(target_lang, 20)
+            expansion_factor = max_expansion or _DEFAULT_EXPANSION.get(target_lang, _DEFAULT_EXPANSION_FALLBACK)
             
-            max_lengths = []
-            for original, translated in zip(texts_to_translate, translated_texts):
-                max_len = int(len(original) * (1 + expansion_factor / 100))
-                max_lengths.append(max_len)
+            expansion_ratio = 1 + expansion_factor / 100
+            max_lengths = [int(len(original) * expansion_ratio) for original in texts_to_translate[:len(translated_texts)]]
             
             # Applica correzioni overflow
-            enhanced_processor = enhanced_processor if post_process else EnhancedTranslationPostProcessor()
             translated_texts = enhanced_processor.apply_overflow_corrections(
                 translated_texts, max_lengths, target_lang
             )
@@ -434,38 +492,14 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
         if verbose:
             click.echo("📋 Traduzione Master Pages...")
         
-        master_content = processor.extract_master_pages_content()
         if master_content:
-            # Estrai testi traducibili dalle master pages
-            master_texts_to_translate = []
-            master_file_mapping = {}
-            
-            for master_file, master_data in master_content.items():
-                translatable_texts = master_data.get('translatable_texts', [])
-                if translatable_texts:
-                    master_file_texts = []
-                    for text_info in translatable_texts:
-                        master_file_texts.append(text_info['content'])
-                        master_texts_to_translate.append(text_info['content'])
-                    master_file_mapping[master_file] = master_file_texts
-            
             if master_texts_to_translate:
                 if verbose:
                     click.echo(f"   📄 Trovati {len(master_texts_to_translate)} testi in master pages")
                 
-                # Traduci testi master pages
-                if async_mode:
-                    # Usa traduttore asincrono per master pages
-                    async def async_translate_masters():
-                        async with AsyncTranslator(
-                            api_key, model, max_concurrent, use_cache
-                        ) as translator:
-                            return await translator.translate_texts_batch(
-                                master_texts_to_translate, target_lang, source_lang, 
-                                final_context, document_context
-                            )
-                    master_translations = asyncio.run(async_translate_masters())
-                else:
+                # Traduci testi master pages (in modalità asincrona già tradotti
+                # nel batch principale)
+                if master_translations is None:
                     # Usa domain translator anche per master pages
                     master_translations = domain_translator.translate_texts(
                         master_texts_to_translate, 
@@ -476,7 +510,6 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
                 
                 # Post-process master page translations
                 if post_process:
-                    enhanced_processor = enhanced_processor if 'enhanced_processor' in locals() else EnhancedTranslationPostProcessor()
                     master_translations = enhanced_processor.process_translations(master_translations, target_lang)
                 
                 # Mappa traduzioni master pages per file
@@ -520,24 +553,27 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
             
             report = detector.generate_overflow_report(predictions, target_lang)
             
-            click.echo("\n📄 REPORT OVERFLOW PREVENTION:")
-            click.echo(f"   Rischio medio: {report['summary']['average_overflow_risk']:.2f}")
-            click.echo(f"   Espansione stimata: {report['summary']['estimated_expansion']}%")
-            click.echo("\n   Distribuzione rischi:")
+            lines = [
+                "\n📄 REPORT OVERFLOW PREVENTION:",
+                f"   Rischio medio: {report['summary']['average_overflow_risk']:.2f}",
+                f"   Espansione stimata: {report['summary']['estimated_expansion']}%",
+                "\n   Distribuzione rischi:",
+            ]
             for risk_level, count in report['risk_distribution'].items():
                 percentage = report['risk_percentages'][risk_level]
-                click.echo(f"   - {risk_level}: {count} ({percentage}%)")
+                lines.append(f"   - {risk_level}: {count} ({percentage}%)")
             
             if report['high_risk_texts']:
-                click.echo("\n   ⚠️ Testi ad alto rischio:")
+                lines.append("\n   ⚠️ Testi ad alto rischio:")
                 for i, high_risk in enumerate(report['high_risk_texts'][:5], 1):
-                    click.echo(f"   {i}. {high_risk['text_preview']}")
-                    click.echo(f"      Rischio: {high_risk['overflow_risk']}")
-                    click.echo(f"      Spazio: {high_risk['available_space']} car.")
+                    lines.append(f"   {i}. {high_risk['text_preview']}")
+                    lines.append(f"      Rischio: {high_risk['overflow_risk']}")
+                    lines.append(f"      Spazio: {high_risk['available_space']} car.")
             
-            click.echo("\n   💡 Raccomandazioni:")
+            lines.append("\n   💡 Raccomandazioni:")
             for rec in report['recommendations']:
-                click.echo(f"   - {rec}")
+                lines.append(f"   - {rec}")
+            click.echo("\n".join(lines))
         
         # 8. Sostituisci nel documento
         if verbose:
@@ -555,16 +591,21 @@ def main(input_file: Path, output: Optional[Path], target_lang: str,
         if verbose:
             click.echo("🔍 Validazione documento tradotto...")
         
-        # Ricarica il documento tradotto per validazione
-        translated_processor = IDMLProcessor(str(output))
-        translated_processor.load_idml()
+        # La validazione lavora sugli alberi in memoria, da cui è stato scritto il file:
+        # non serve ricaricare il documento tradotto
         
         # Validazione integrità XML
-        xml_validation = translated_processor.validate_xml_tag_integrity()
+        xml_validation = processor.validate_xml_tag_integrity()
+        
+        # Verifica dei byte salvati: il file riaperto contiene XML valido nelle parti riscritte
+        saved_validation = processor.validate_saved_package(str(output))
+        if not saved_validation['is_valid']:
+            xml_validation['is_valid'] = False
+            xml_validation['errors'].extend(saved_validation['errors'])
         
         # Validazione consistenza stili se richiesta
         if check_consistency:
-            translated_style_analysis = translated_processor.analyze_style_consistency()
+            translated_style_analysis = processor.analyze_style_consistency()
             style_validation = processor.validate_style_preservation(original_style_analysis, translated_style_analysis)
             
             if not style_validation['is_valid'] and style_validation['discrepancies']:
@@ -611,18 +652,22 @@ def cli():
 @cli.command()
 def languages():
     """Mostra le lingue supportate"""
+    from translator import Translator
+    
     translator = Translator("dummy_key")  # Non serve chiave valida per questo
     langs = translator.get_supported_languages()
     
-    click.echo("🌍 Lingue supportate:")
-    for code, name in sorted(langs.items()):
-        click.echo(f"   {code:3} - {name}")
+    lines = ["🌍 Lingue supportate:"]
+    lines += [f"   {code:3} - {name}" for code, name in sorted(langs.items())]
+    click.echo("\n".join(lines))
 
 
 @cli.command()
 @click.argument('input_file', type=click.Path(exists=True, path_type=Path))
 def info(input_file: Path):
     """Mostra informazioni su un file IDML"""
+    from idml_processor import IDMLProcessor
+    from text_extractor import TextExtractor
     
     if not input_file.suffix.lower() == '.idml':
         click.echo("Errore: Il file deve essere un file .idml", err=True)
@@ -686,6 +731,10 @@ def batch(input_files: tuple, target_lang: str, output_dir: Optional[Path],
           check_consistency: bool, verbose: bool, prevent_overflow: bool,
           max_expansion: Optional[int], compression_mode: str):
     """Traduce più file IDML in batch con consistenza garantita"""
+    from idml_processor import IDMLProcessor
+    from text_extractor import TextExtractor
+    from context_detector import DocumentContextDetector
+    from translation_memory import TranslationMemory
     
     if not api_key:
         click.echo("Errore: Chiave API OpenAI richiesta per batch", err=True)
@@ -766,6 +815,9 @@ def batch(input_files: tuple, target_lang: str, output_dir: Optional[Path],
                       update_tm=True,
                       async_mode=True,
                       max_concurrent=5,
+                      prompts_per_request=1,
+                      max_rpm=None,
+                      max_tpm=None,
                       source_lang=None,
                       post_process=True,
                       prevent_overflow=prevent_overflow,
@@ -800,6 +852,7 @@ def batch(input_files: tuple, target_lang: str, output_dir: Optional[Path],
 def tm(export: Optional[str], source_lang: Optional[str], 
        target_lang: Optional[str], stats: bool):
     """Gestisce la Translation Memory"""
+    from translation_memory import TranslationMemory
     
     tm = TranslationMemory()
     
@@ -5,12 +5,15 @@ Overflow Detector - Analizza frame di testo IDML e predice potenziali overflow
 import re
 import math
 from typing import Dict, List, Tuple, Optional, Any
-from xml.etree import ElementTree as ET
+from lxml import etree as ET
 from dataclasses import dataclass
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Parser lxml condiviso (spread di grandi dimensioni, senza indice degli ID)
+_XML_PARSER = ET.XMLParser(huge_tree=True, collect_ids=False)
+
 @dataclass
 class TextFrameMetrics:
     """Metriche di un text frame IDML"""
@@ -112,11 +115,9 @@ class OverflowDetector:
             spreads = self._get_spread_files(idml_processor)
             
             for spread_path in spreads:
+                # Parse direttamente dai byte: nessuna copia str intermedia
                 spread_content = idml_processor.idml_package.read(spread_path)
-                if isinstance(spread_content, bytes):
-                    spread_content = spread_content.decode('utf-8')
-                
-                spread_root = ET.fromstring(spread_content)
+                spread_root = ET.fromstring(spread_content, _XML_PARSER)
                 frame_metrics = self._extract_textframe_metrics(spread_root, spread_path)
                 frames_metrics.update(frame_metrics)
                 
@@ -128,33 +129,24 @@ class OverflowDetector:
     
     def _get_spread_files(self, idml_processor) -> List[str]:
         """Ottiene lista dei file spread dal package IDML"""
-        spread_files = []
-        
         try:
-            for file_info in idml_processor.idml_package.infolist():
-                if file_info.filename.startswith('Spreads/') and file_info.filename.endswith('.xml'):
-                    spread_files.append(file_info.filename)
+            return idml_processor.get_xml_files('Spreads')
         except Exception as e:
             logger.error(f"Errore lettura spreads: {e}")
-        
-        return spread_files
+            return []
     
     def _extract_textframe_metrics(self, spread_root: ET.Element, spread_path: str) -> Dict[str, TextFrameMetrics]:
         """Estrae metriche dai text frame in uno spread"""
         metrics = {}
         
-        def remove_namespace(tag):
-            return tag.split('}')[-1] if '}' in tag else tag
-        
-        # Cerca tutti i TextFrame nello spread
-        for element in spread_root.iter():
-            if remove_namespace(element.tag) == 'TextFrame':
-                try:
-                    frame_metrics = self._parse_textframe_element(element, spread_path)
-                    if frame_metrics:
-                        metrics[frame_metrics.frame_id] = frame_metrics
-                except Exception as e:
-                    logger.warning(f"Errore parsing TextFrame in {spread_path}: {e}")
+        # Cerca tutti i TextFrame nello spread (filtro sul tag eseguito da lxml)
+        for element in spread_root.iter('{*}TextFrame'):
+            try:
+                frame_metrics = self._parse_textframe_element(element, spread_path)
+                if frame_metrics:
+                    metrics[frame_metrics.frame_id] = frame_metrics
+            except Exception as e:
+                logger.warning(f"Errore parsing TextFrame in {spread_path}: {e}")
         
         return metrics
     
@@ -260,8 +252,8 @@ class OverflowDetector:
         """Conta caratteri nel text frame"""
         char_count = 0
         
-        # Cerca tutti gli elementi con testo
-        for elem in textframe_elem.iter():
+        # Cerca tutti gli elementi con testo (esclusi commenti e PI)
+        for elem in textframe_elem.iter(ET.Element):
             if elem.text:
                 char_count += len(elem.text.strip())
             if elem.tail:
@@ -619,7 +611,8 @@ class OverflowDetector:
             if 'root' in story_data:
                 # Estrai tutto il testo dalla story
                 for elem in story_data['root'].iter():
-                    if elem.text:
+                    # Salta il testo di commenti e Processing Instructions
+                    if isinstance(elem.tag, str) and elem.text:
                         all_text += elem.text + " "
                     if elem.tail:
                         all_text += elem.tail + " "
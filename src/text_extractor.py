@@ -3,6 +3,7 @@ Text Extractor - Estrae e organizza il testo dai file IDML per la traduzione
 """
 
 import re
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
 from xml.etree import ElementTree as ET
 
@@ -17,6 +18,16 @@ except ImportError:
     def load_project_glossary(path): return TranslationGlossary()
 
 
+@lru_cache(maxsize=512)
+def _strip_namespace(tag) -> str:
+    """Rimuove il namespace da un tag XML; i tag distinti sono pochi, il risultato è in cache"""
+    # Commenti e Processing Instructions (lxml) hanno un tag non stringa
+    if not isinstance(tag, str):
+        return ''
+    i = tag.find('}')
+    return tag[i + 1:] if i >= 0 else tag
+
+
 class TextExtractor:
     """Classe per estrarre e processare testo da contenuti IDML"""
     
@@ -30,6 +41,10 @@ class TextExtractor:
         self.text_segments = []
         self.text_mapping = {}
         
+        # Cache dei risultati del filtro per (testo ripulito, lingua): header, footer
+        # ed etichette si ripetono spesso in tutto il documento
+        self._translatable_cache: Dict[Tuple[str, Optional[str]], bool] = {}
+        
         # Carica glossario
         if project_path:
             self.glossary = load_project_glossary(project_path)
@@ -117,34 +132,33 @@ class TextExtractor:
         # NUOVO APPROCCIO: cerca specificamente elementi Content dentro CharacterStyleRange
         # Struttura IDML: Story > ParagraphStyleRange > CharacterStyleRange > Content
         
-        # Rimuovi namespace per semplificare la ricerca
-        def remove_namespace(tag):
-            return tag.split('}')[-1] if '}' in tag else tag
-        
         # Cerca tutti i CharacterStyleRange
         for element in root.iter():
-            element_tag = remove_namespace(element.tag)
+            element_tag = _strip_namespace(element.tag)
             
             if element_tag == 'CharacterStyleRange':
                 # Cerca elementi Content dentro questo CharacterStyleRange
                 for content_elem in element:
-                    content_tag = remove_namespace(content_elem.tag)
+                    content_tag = _strip_namespace(content_elem.tag)
                     
                     if content_tag == 'Content':
-                        # Estrai il testo solo dai Content elements
-                        if content_elem.text and content_elem.text.strip():
+                        # Estrai il testo solo dai Content elements (isspace() scarta
+                        # i testi vuoti senza allocare; strip() solo su quelli tenuti)
+                        text = content_elem.text
+                        if text and not text.isspace():
                             text_elements.append({
                                 'element': content_elem,
-                                'text': content_elem.text.strip(),
+                                'text': text.strip(),
                                 'text_type': 'text',
                                 'parent_style': element.get('AppliedCharacterStyle', 'default')
                             })
                         
                         # Content elements non dovrebbero avere tail text, ma controlliamo comunque
-                        if content_elem.tail and content_elem.tail.strip():
+                        tail = content_elem.tail
+                        if tail and not tail.isspace():
                             text_elements.append({
                                 'element': content_elem,
-                                'text': content_elem.tail.strip(),
+                                'text': tail.strip(),
                                 'text_type': 'tail',
                                 'parent_style': element.get('AppliedCharacterStyle', 'default')
                             })
@@ -152,6 +166,26 @@ class TextExtractor:
         return text_elements
     
     def _is_translatable_text(self, text: str, lang: str = None) -> bool:
+        """
+        Determina se un testo è traducibile, riusando i risultati già calcolati
+        
+        Args:
+            text: Testo da valutare
+            lang: Codice lingua target per dizionari specifici
+            
+        Returns:
+            True se il testo è traducibile
+        """
+        if not text:
+            return False
+        
+        key = (text.strip(), lang)
+        result = self._translatable_cache.get(key)
+        if result is None:
+            result = self._translatable_cache[key] = self._check_translatable_text(key[0], lang)
+        return result
+    
+    def _check_translatable_text(self, text: str, lang: str = None) -> bool:
         """
         Determina se un testo è traducibile (esclude codici, numeri puri, etc.)
         
@@ -9,9 +9,23 @@ from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from difflib import SequenceMatcher
+from functools import lru_cache
 import os
 
 
+@lru_cache(maxsize=256)
+def _context_hash(context: Optional[str], document_type: Optional[str],
+                  target_lang: Optional[str]) -> str:
+    """
+    MD5 abbreviato di contesto, tipo documento e lingua target
+    
+    Il contesto (spesso un prompt lungo) è lo stesso oggetto per tutto un batch:
+    in cache la chiave costa un lookup, senza ricostruire e riapplicare l'MD5
+    """
+    context_str = f"{context or ''}{document_type or ''}{target_lang or ''}"
+    return hashlib.md5(context_str.encode()).hexdigest()[:8]
+
+
 class TranslationMemory:
     """Gestisce la memoria delle traduzioni per garantire consistenza e velocità"""
     
@@ -334,8 +348,7 @@ class TranslationMemory:
             Hash del contesto inclusa la lingua target
         """
         # CRITICO: Includi lingua target per separare cache per lingua
-        context_str = f"{context or ''}{document_type or ''}{target_lang or ''}"
-        return hashlib.md5(context_str.encode()).hexdigest()[:8]
+        return _context_hash(context, document_type, target_lang)
         
     def export_tmx(self, output_path: str, source_lang: str, 
                   target_lang: str, min_usage: int = 1):
@@ -0,0 +1,236 @@
+"""
+Test per AsyncTranslator
+"""
+
+import asyncio
+import os
+import sys
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from async_translator import AsyncTranslator
+
+
+def _response(content):
+    """Risposta API simulata con il contenuto indicato"""
+    response = Mock()
+    response.choices = [Mock()]
+    response.choices[0].message.content = content
+    response.usage.total_tokens = 10
+    return response
+
+
+def _single_reply(messages):
+    """Risposta a una richiesta singola: 'Translate: X' -> 'T(X)'"""
+    text = messages[-1]['content'][len('Translate: '):]
+    return _response(f"T({text})")
+
+
+class _MockedClientTest:
+    """Base dei test: AsyncOpenAI sostituito da un client simulato (self.mock_client)"""
+
+    def setup_method(self):
+        """Setup per ogni test"""
+        self.openai_patcher = patch('async_translator.AsyncOpenAI')
+        mock_openai_class = self.openai_patcher.start()
+        self.mock_client = Mock()
+        mock_openai_class.return_value = self.mock_client
+
+    def teardown_method(self):
+        """Rimuove il mock del client"""
+        self.openai_patcher.stop()
+
+
+class TestAsyncTranslatorGroups(_MockedClientTest):
+
+    def setup_method(self):
+        """Setup per ogni test"""
+        super().setup_method()
+        self.texts = ["Uno", "Due", "Tre"]
+
+    def _translator(self, group_reply, prompts_per_request=3):
+        """Translator con client simulato: group_reply risponde alle richieste di gruppo"""
+        async def create(model, messages, temperature, max_tokens):
+            if messages[-1]['content'].startswith('Translate:\n'):
+                return _response(group_reply)
+            return _single_reply(messages)
+
+        self.mock_client.chat.completions.create = AsyncMock(side_effect=create)
+        return AsyncTranslator("test_api_key", use_cache=False,
+                               prompts_per_request=prompts_per_request)
+
+    def _group_calls(self):
+        """Numero di richieste di gruppo inviate"""
+        return sum(
+            call.kwargs['messages'][-1]['content'].startswith('Translate:\n')
+            for call in self.mock_client.chat.completions.create.call_args_list
+        )
+
+    def test_group_request_success(self):
+        """Testi su una riga tradotti con una sola richiesta numerata"""
+        translator = self._translator("1. Eins\n2. Zwei\n3. Drei")
+
+        result = asyncio.run(translator.translate_texts_batch(self.texts, "de"))
+
+        assert result == ["Eins", "Zwei", "Drei"]
+        assert self.mock_client.chat.completions.create.call_count == 1
+        assert translator.stats['api_calls'] == 1
+        assert translator.stats['api_translations'] == 3
+        assert translator.stats['group_fallbacks'] == 0
+
+    def test_group_request_wrong_count_falls_back(self):
+        """Una traduzione mancante: il gruppo viene ritradotto con richieste singole"""
+        translator = self._translator("1. Eins\n2. Zwei")
+
+        result = asyncio.run(translator.translate_texts_batch(self.texts, "de"))
+
+        assert result == ["T(Uno)", "T(Due)", "T(Tre)"]
+        assert self._group_calls() == 1
+        assert self.mock_client.chat.completions.create.call_count == 4
+
+    def test_group_fallback_statistics(self):
+        """Ogni richiesta inviata conta una volta; il ripiego è registrato a parte"""
+        translator = self._translator("1. Eins\n2. Zwei")
+
+        asyncio.run(translator.translate_texts_batch(self.texts, "de"))
+        stats = translator.get_statistics()
+
+        assert stats['api_calls'] == 4
+        assert stats['api_translations'] == 3
+        assert stats['group_fallbacks'] == 1
+        assert stats['avg_time_per_call'] == stats['total_time'] / 4
+        assert stats['cache_hit_rate'] == 0
+
+    def test_group_request_bad_numbering_falls_back(self):
+        """Stesso numero di righe ma numerazione errata: nessun disallineamento"""
+        # Il 2 manca e una traduzione spezzata aggiunge una riga numerata
+        translator = self._translator("1. Eins\n3. Drei\n4. (Fortsetzung)")
+
+        result = asyncio.run(translator.translate_texts_batch(self.texts, "de"))
+
+        assert result == ["T(Uno)", "T(Due)", "T(Tre)"]
+
+    def test_translate_group_rejects_out_of_order_numbering(self):
+        """_translate_group_async accetta solo righe numerate 1..N in ordine"""
+        translator = self._translator("2. Zwei\n1. Eins\n3. Drei")
+
+        with pytest.raises(ValueError):
+            asyncio.run(translator._translate_group_async(self.texts, "de"))
+
+    def test_multiline_text_sent_alone(self):
+        """I testi su più righe non entrano nei gruppi"""
+        translator = self._translator("1. Eins\n2. Drei")
+
+        result = asyncio.run(translator.translate_texts_batch(["Uno", "Due\nrighe", "Tre"], "de"))
+
+        assert result == ["Eins", "T(Due\nrighe)", "Drei"]
+        assert self._group_calls() == 1
+
+    def test_single_prompt_per_request_by_default(self):
+        """Con prompts_per_request=1 ogni testo ha la sua richiesta"""
+        translator = self._translator("", prompts_per_request=1)
+
+        result = asyncio.run(translator.translate_texts_batch(self.texts, "de"))
+
+        assert result == ["T(Uno)", "T(Due)", "T(Tre)"]
+        assert self._group_calls() == 0
+
+
+class _FakeClock:
+    """Orologio simulato: asyncio.sleep fa avanzare il tempo senza attendere"""
+
+    def __init__(self, translator=None):
+        self.now = 0.0
+        self.sleeps = []
+        self.semaphore_locked = []
+        self.translator = translator
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        if self.translator is not None:
+            self.semaphore_locked.append(self.translator.semaphore.locked())
+        self.now += delay
+
+
+class TestAsyncTranslatorRateLimits(_MockedClientTest):
+
+    def setup_method(self):
+        """Setup per ogni test"""
+        super().setup_method()
+        self.mock_client.chat.completions.create = AsyncMock(
+            side_effect=lambda model, messages, temperature, max_tokens: _single_reply(messages)
+        )
+        self.clock = _FakeClock()
+
+    def _translator(self, **limits):
+        """Translator con limiti al minuto e orologio simulato"""
+        with patch('async_translator.time.monotonic', self.clock.monotonic):
+            translator = AsyncTranslator("test_api_key", use_cache=False, **limits)
+        self.clock.translator = translator
+        return translator
+
+    def _wait(self, translator, messages, max_tokens, times=1):
+        """Chiama _wait_for_capacity più volte con l'orologio simulato"""
+        async def wait_all():
+            for _ in range(times):
+                await translator._wait_for_capacity(messages, max_tokens)
+
+        with patch('async_translator.time.monotonic', self.clock.monotonic), \
+                patch('async_translator.asyncio.sleep', self.clock.sleep):
+            asyncio.run(wait_all())
+
+    def test_no_limits_never_waits(self):
+        """Senza max_rpm e max_tpm le richieste partono subito"""
+        translator = self._translator()
+
+        self._wait(translator, [{'role': 'user', 'content': 'x' * 400}], 1000, times=100)
+
+        assert self.clock.sleeps == []
+
+    def test_request_limit_waits_for_refill(self):
+        """Esaurite le richieste al minuto, ogni nuova richiesta attende 60/max_rpm secondi"""
+        translator = self._translator(max_rpm=60)
+
+        self._wait(translator, [{'role': 'user', 'content': 'Ciao'}], 10, times=60)
+        assert self.clock.sleeps == []
+
+        self._wait(translator, [{'role': 'user', 'content': 'Ciao'}], 10, times=2)
+        assert self.clock.now == pytest.approx(2.0)
+
+    def test_token_limit_waits_for_refill(self):
+        """I token stimati (prompt/4 + max_tokens) vengono scalati dalla capacità al minuto"""
+        translator = self._translator(max_tpm=1000)
+        messages = [{'role': 'user', 'content': 'x' * 400}]  # 100 token + 400 di risposta
+
+        self._wait(translator, messages, 400, times=2)
+        assert self.clock.sleeps == []
+
+        self._wait(translator, messages, 400)
+        assert self.clock.now == pytest.approx(30.0)
+
+    def test_request_larger_than_token_limit_waits_for_full_capacity(self):
+        """Una richiesta oltre max_tpm non attende per sempre: basta la capacità piena"""
+        translator = self._translator(max_tpm=1000)
+        self._wait(translator, [{'role': 'user', 'content': 'x'}], 1000)
+
+        self._wait(translator, [{'role': 'user', 'content': 'x' * 8000}], 5000)
+
+        assert self.clock.now == pytest.approx(60.0)
+
+    def test_capacity_acquired_before_semaphore(self):
+        """Chi attende capacità non occupa uno slot di concorrenza"""
+        translator = self._translator(max_concurrent=1, max_rpm=2)
+
+        with patch('async_translator.time.monotonic', self.clock.monotonic), \
+                patch('async_translator.asyncio.sleep', self.clock.sleep):
+            result = asyncio.run(translator.translate_texts_batch(["Uno", "Due", "Tre", "Quattro"], "de"))
+
+        assert result == ["T(Uno)", "T(Due)", "T(Tre)", "T(Quattro)"]
+        assert self.clock.now == pytest.approx(60.0)
+        assert self.clock.semaphore_locked
+        assert not any(self.clock.semaphore_locked)
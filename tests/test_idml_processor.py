@@ -0,0 +1,233 @@
+"""
+Test per IDMLProcessor
+"""
+
+import os
+import re
+import sys
+import zipfile
+from lxml import etree as ET
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from idml_processor import IDMLProcessor, _MALFORMED_PATTERNS, _validate_story
+from text_extractor import TextExtractor
+
+
+# Story con una tabella annidata nel CharacterStyleRange, seguita da altro Content:
+# l'ordine dell'estrazione (range per range) differisce dall'ordine di documento
+NESTED_TABLE_STORY = b"""<idPkg:Story xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" DOMVersion="20.4">
+    <Story Self="u100">
+        <ParagraphStyleRange AppliedParagraphStyle="ParagraphStyle/$ID/NormalParagraphStyle">
+            <CharacterStyleRange AppliedCharacterStyle="CharacterStyle/$ID/[No character style]">
+                <Content>Testo prima della tabella</Content>
+                <Table Self="u100i">
+                    <Cell Self="u100i0">
+                        <ParagraphStyleRange AppliedParagraphStyle="ParagraphStyle/$ID/NormalParagraphStyle">
+                            <CharacterStyleRange AppliedCharacterStyle="CharacterStyle/$ID/[No character style]">
+                                <Content>Testo nella cella della tabella</Content>
+                            </CharacterStyleRange>
+                        </ParagraphStyleRange>
+                    </Cell>
+                </Table>
+                <Content>Testo dopo la tabella</Content>
+            </CharacterStyleRange>
+        </ParagraphStyleRange>
+    </Story>
+</idPkg:Story>"""
+
+
+# Story in cui più pattern di tag malformati riconoscono lo stesso tag
+# ("<Note Self="n1" >" ha spazi prima della chiusura ed è un tag a fine riga)
+OVERLAPPING_MALFORMED_STORY = """<Story Self="u300">
+<CharacterStyleRange><Content>Testo</Content></CharacterStyleRange>
+<Note Self="n1" >
+</Note>
+<Br />
+</Story>"""
+
+SIMPLE_STORY = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<idPkg:Story xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" DOMVersion="20.4">
+    <Story Self="u200">
+        <ParagraphStyleRange AppliedParagraphStyle="ParagraphStyle/$ID/NormalParagraphStyle">
+            <CharacterStyleRange AppliedCharacterStyle="CharacterStyle/$ID/[No character style]">
+                <Content>Testo da tradurre</Content>
+            </CharacterStyleRange>
+        </ParagraphStyleRange>
+    </Story>
+</idPkg:Story>"""
+
+PACKAGE_ENTRIES = {
+    'designmap.xml': b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     b'<Document xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" '
+                     b'DOMVersion="20.4" Self="d"><idPkg:Story src="Stories/Story_u200.xml"/></Document>',
+    'Resources/Preferences.xml': b'<idPkg:Preferences xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" '
+                                 b'DOMVersion="20.4"><TextPreference/></idPkg:Preferences>',
+    'Resources/Styles.xml': b'<idPkg:Styles xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" '
+                            b'DOMVersion="20.4">' + b'<ParagraphStyle Self="p"/>' * 200 + b'</idPkg:Styles>',
+    'MasterSpreads/MasterSpread_u300.xml': b'<idPkg:MasterSpread xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" '
+                                           b'DOMVersion="20.4"><MasterSpread Self="u300">'
+                                           b'<TextFrame Self="u301" ParentStory="u200"/></MasterSpread></idPkg:MasterSpread>',
+    'Spreads/Spread_u400.xml': b'<idPkg:Spread xmlns:idPkg="http://ns.adobe.com/AdobeInDesign/idml/1.0/packaging" '
+                               b'DOMVersion="20.4"><Spread Self="u400"/></idPkg:Spread>',
+    'Stories/Story_u200.xml': SIMPLE_STORY,
+}
+
+
+class TestIDMLProcessor:
+
+    def setup_method(self):
+        """Setup per ogni test"""
+        self.extractor = TextExtractor()
+
+    def _make_processor(self, tmp_path, stories):
+        """Processor con stories già parsate (senza caricare un package)"""
+        idml_file = tmp_path / "test.idml"
+        idml_file.write_bytes(b"")
+        processor = IDMLProcessor(str(idml_file))
+        processor.stories_data = {
+            name: {'root': ET.fromstring(content)} for name, content in stories.items()
+        }
+        return processor
+
+    def test_replace_text_content_follows_extraction_order(self, tmp_path):
+        """Le traduzioni finiscono sui Content da cui sono stati estratti i testi"""
+        processor = self._make_processor(tmp_path, {'Stories/Story_u100.xml': NESTED_TABLE_STORY})
+
+        segments = self.extractor.extract_translatable_text(processor.stories_data)
+        texts = [segment['original_text'] for segment in segments]
+        assert texts == [
+            'Testo prima della tabella',
+            'Testo dopo la tabella',
+            'Testo nella cella della tabella',
+        ]
+
+        translations = self.extractor.map_translations_to_segments(
+            segments, [f"DE: {text}" for text in texts]
+        )
+        processor.replace_text_content(translations, 'de')
+
+        root = processor.stories_data['Stories/Story_u100.xml']['root']
+        contents = [element.text for element in root.iter('Content')]
+        assert contents == [
+            'DE: Testo prima della tabella',
+            'DE: Testo nella cella della tabella',
+            'DE: Testo dopo la tabella',
+        ]
+
+    def test_replace_text_content_reuses_element_index(self, tmp_path):
+        """Una seconda sostituzione sulla stessa story segue lo stesso ordine"""
+        processor = self._make_processor(tmp_path, {'Stories/Story_u100.xml': NESTED_TABLE_STORY})
+        story_name = 'Stories/Story_u100.xml'
+
+        first = ['Erster Text', 'Zweiter Text', 'Dritter Text']
+        second = ['Premier texte', 'Deuxième texte', 'Troisième texte']
+        processor.replace_text_content({story_name: first})
+        processor.replace_text_content({story_name: second})
+
+        root = processor.stories_data[story_name]['root']
+        assert [element.text for element in root.iter('Content')] == [
+            'Premier texte', 'Troisième texte', 'Deuxième texte'
+        ]
+
+    def _write_package(self, tmp_path):
+        """Package IDML minimo: mimetype non compresso e in testa, poi le altre entry"""
+        idml_file = tmp_path / "source.idml"
+        with zipfile.ZipFile(idml_file, 'w', zipfile.ZIP_DEFLATED) as package:
+            package.writestr(zipfile.ZipInfo('mimetype'), 'application/vnd.adobe.indesign-idml-package',
+                             compress_type=zipfile.ZIP_STORED)
+            for name, content in PACKAGE_ENTRIES.items():
+                package.writestr(name, content)
+        return idml_file
+
+    def _translated_package(self, tmp_path, **save_options):
+        """Carica il package, traduce la story e lo salva"""
+        processor = IDMLProcessor(str(self._write_package(tmp_path)))
+        processor.load_idml()
+        processor.replace_text_content({'Stories/Story_u200.xml': ['Zu übersetzender Text']})
+        output_file = tmp_path / "output.idml"
+        processor.save_translated_idml(str(output_file), **save_options)
+        processor.idml_package.close()
+        self.processor = processor
+        return output_file
+
+    def test_save_round_trip_is_valid_package(self, tmp_path):
+        """Il package salvato supera testzip e mimetype resta primo e non compresso"""
+        output_file = self._translated_package(tmp_path)
+
+        with zipfile.ZipFile(output_file) as package:
+            assert package.testzip() is None
+            first = package.infolist()[0]
+            assert first.filename == 'mimetype'
+            assert first.compress_type == zipfile.ZIP_STORED
+            assert package.read('mimetype') == b'application/vnd.adobe.indesign-idml-package'
+            assert package.namelist() == ['mimetype'] + list(PACKAGE_ENTRIES)
+
+    def test_save_copies_unmodified_entries_unchanged(self, tmp_path):
+        """Le entry non modificate hanno stesso contenuto, CRC e metodo di compressione"""
+        output_file = self._translated_package(tmp_path)
+
+        with zipfile.ZipFile(tmp_path / "source.idml") as source, zipfile.ZipFile(output_file) as output:
+            for name in ['mimetype', 'designmap.xml', 'Resources/Preferences.xml', 'Resources/Styles.xml']:
+                source_info, output_info = source.getinfo(name), output.getinfo(name)
+                assert output.read(name) == source.read(name)
+                assert output_info.CRC == source_info.CRC
+                assert output_info.compress_type == source_info.compress_type
+
+    def test_save_writes_translated_story(self, tmp_path):
+        """La story tradotta viene riscritta con la compressione richiesta"""
+        output_file = self._translated_package(tmp_path, compression=zipfile.ZIP_STORED)
+
+        with zipfile.ZipFile(output_file) as package:
+            info = package.getinfo('Stories/Story_u200.xml')
+            assert info.compress_type == zipfile.ZIP_STORED
+            root = ET.fromstring(package.read(info))
+            assert [element.text for element in root.iter('Content')] == ['Zu übersetzender Text']
+
+    def test_validate_story_reports_overlapping_malformed_matches(self):
+        """Ogni pattern riporta tutte le sue corrispondenze, anche se sovrapposte ad altre"""
+        result = _validate_story('Stories/Story_u300.xml', OVERLAPPING_MALFORMED_STORY)
+
+        expected = []
+        for pattern in _MALFORMED_PATTERNS:
+            matches = re.findall(pattern, OVERLAPPING_MALFORMED_STORY, re.MULTILINE)
+            if matches:
+                expected.append((pattern, matches[:5]))
+        assert [(broken['pattern'], broken['matches']) for broken in result['broken_tags']] == expected
+        assert any('<Note Self="n1" >' in matches for _, matches in expected[1:])
+
+    def test_validate_saved_package_accepts_saved_output(self, tmp_path):
+        """Il package appena salvato supera la verifica dei byte scritti"""
+        output_file = self._translated_package(tmp_path)
+
+        assert self.processor.validate_saved_package(str(output_file)) == {'is_valid': True, 'errors': []}
+
+    def test_validate_saved_package_detects_broken_story(self, tmp_path):
+        """Una story riscritta non ben formata viene segnalata"""
+        output_file = self._translated_package(tmp_path)
+        broken_file = tmp_path / "broken.idml"
+        with zipfile.ZipFile(output_file) as source, zipfile.ZipFile(broken_file, 'w') as target:
+            for info in source.infolist():
+                content = source.read(info)
+                if info.filename == 'Stories/Story_u200.xml':
+                    content = content.replace(b'</Content>', b'')
+                target.writestr(info, content)
+
+        result = self.processor.validate_saved_package(str(broken_file))
+
+        assert not result['is_valid']
+        assert len(result['errors']) == 1
+        assert 'Stories/Story_u200.xml' in result['errors'][0]
+
+    def test_spread_and_master_bytes_released_once_parsed(self, tmp_path):
+        """I byte di spread e master spread escono dalla cache una volta elaborati"""
+        processor = IDMLProcessor(str(self._write_package(tmp_path)))
+        processor.load_idml()
+
+        master_content = processor.extract_master_pages_content()
+        processor._get_spread_root('Spreads/Spread_u400.xml')
+
+        assert 'MasterSpreads/MasterSpread_u300.xml' in master_content
+        assert 'MasterSpreads/MasterSpread_u300.xml' not in processor._read_cache
+        assert 'Spreads/Spread_u400.xml' not in processor._read_cache
+        processor.idml_package.close()